@@ -0,0 +1,240 @@
+"""
+Nearest-neighbour search over L2-normalized speaker embeddings.
+
+``BruteForceIndex`` scans every vector exactly. ``IVFIndex`` clusters the gallery
+with spherical k-means and only scans the ``nprobe`` closest clusters per query,
+trading recall for speed: ``nlist`` sets how finely the gallery is split and
+``nprobe`` how many clusters are searched. Both return ``(scores, ids)`` arrays of
+shape ``(num_queries, k)`` with the best match first, and support ``remove`` and
+``copy``, so either can back ``SpeakerRegistry(index=...)``.
+"""
+import numpy as np
+from speaker_registry import l2_normalize, top_k
+
+# Constants
+MIN_IVF_SIZE = 10000  # Below this many vectors an exhaustive scan is already fast enough
+
+
+def _as_queries(queries):
+    return np.atleast_2d(l2_normalize(queries))
+
+
+def _pad_results(scores, ids, k):
+    # Fewer than k candidates: pad with -inf scores and -1 ids
+    out_scores = np.full(k, -np.inf, dtype=np.float32)
+    out_ids = np.full(k, -1, dtype=np.int64)
+    out_scores[:len(scores)] = scores
+    out_ids[:len(ids)] = ids
+    return out_scores, out_ids
+
+
+def spherical_kmeans(embeddings, n_clusters, n_iter=10, seed=0, chunk_size=65536):
+    """Cluster unit vectors by cosine similarity, returning (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(embeddings))
+    centroids = embeddings[rng.choice(len(embeddings), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_clusters(embeddings, centroids, chunk_size)
+        order = np.argsort(assign, kind="stable")
+        clusters, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(embeddings[order], starts, axis=0)
+        # Clusters that lost every member keep their previous centroid
+        centroids[clusters] = l2_normalize(sums)
+    return centroids, assign_clusters(embeddings, centroids, chunk_size)
+
+
+def assign_clusters(embeddings, centroids, chunk_size=65536):
+    """Index of the most similar centroid for every embedding."""
+    assign = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), chunk_size):
+        assign[start:start + chunk_size] = np.argmax(embeddings[start:start + chunk_size] @ centroids.T, axis=1)
+    return assign
+
+
+class BruteForceIndex:
+    """Exact cosine search over every stored vector."""
+
+    def __init__(self, dim=192):
+        self.dim = dim
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def copy(self):
+        other = BruteForceIndex(self.dim)
+        other.vectors, other.ids = self.vectors.copy(), self.ids.copy()
+        return other
+
+    def add(self, ids, embeddings):
+        """Add vectors; ids that are already present are replaced."""
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove(ids)
+        self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, np.atleast_2d(l2_normalize(embeddings))]))
+        self.ids = np.concatenate([self.ids, ids])
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, ids)
+        if not keep.all():
+            self.vectors, self.ids = self.vectors[keep], self.ids[keep]
+
+    def search(self, queries, k=10):
+        queries = _as_queries(queries)
+        all_scores = queries @ self.vectors.T
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        ids = np.empty((len(queries), k), dtype=np.int64)
+        for q, row in enumerate(all_scores):
+            idx = top_k(row, k)
+            scores[q], ids[q] = _pad_results(row[idx], self.ids[idx], k)
+        return scores, ids
+
+
+class IVFIndex:
+    """
+    Inverted-file index: k-means coarse quantizer plus one contiguous array per cluster.
+
+    Each list is allocated with spare capacity, so adding a vector is an amortized
+    append to its list and removing one moves the list's last row into the hole;
+    neither touches the rest of the gallery. Until ``min_train_size`` vectors have
+    been added the index is untrained, keeps everything in a single list and
+    searches it exhaustively; reaching the size trains the centroids and
+    redistributes the vectors once.
+    """
+
+    def __init__(self, dim=192, nlist=None, nprobe=8, n_iter=10, train_size=50000, min_train_size=MIN_IVF_SIZE,
+                 seed=0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.centroids = None
+        self._reset(1)
+
+    def _reset(self, nlist):
+        # List c holds _sizes[c] rows of _vectors[c] / _ids[c]; _where maps id -> (list, row)
+        self._vectors = [np.empty((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._sizes = np.zeros(nlist, dtype=np.int64)
+        self._where = {}
+
+    def __len__(self):
+        return len(self._where)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def copy(self):
+        other = IVFIndex(self.dim, self.nlist, self.nprobe, self.n_iter, self.train_size, self.min_train_size,
+                         self.seed)
+        other.centroids = None if self.centroids is None else self.centroids.copy()
+        other._vectors = [vectors.copy() for vectors in self._vectors]
+        other._ids = [ids.copy() for ids in self._ids]
+        other._sizes = self._sizes.copy()
+        other._where = dict(self._where)
+        return other
+
+    def _stored(self):
+        """(ids, vectors) of everything in the index."""
+        ids = np.concatenate([ids[:n] for ids, n in zip(self._ids, self._sizes)])
+        vectors = np.concatenate([vectors[:n] for vectors, n in zip(self._vectors, self._sizes)])
+        return ids, vectors
+
+    def train(self, embeddings=None):
+        """Learn the coarse centroids from (a sample of) ``embeddings`` or the stored vectors."""
+        stored_ids, stored = self._stored()
+        embeddings = stored if embeddings is None else l2_normalize(embeddings)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(embeddings))))
+        if len(embeddings) > self.train_size:
+            rng = np.random.default_rng(self.seed)
+            embeddings = embeddings[rng.choice(len(embeddings), self.train_size, replace=False)]
+        self.centroids, _ = spherical_kmeans(embeddings, nlist, self.n_iter, self.seed)
+        self.nlist = len(self.centroids)
+        # Vectors added before training move to their clusters
+        self._reset(self.nlist)
+        if len(stored_ids):
+            self._insert(stored_ids, stored)
+
+    def _append(self, c, ids, vectors):
+        size, n = self._sizes[c], len(ids)
+        if size + n > len(self._ids[c]):
+            capacity = max(2 * len(self._ids[c]), size + n, 16)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:size] = self._vectors[c][:size]
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:size] = self._ids[c][:size]
+            self._vectors[c], self._ids[c] = grown, grown_ids
+        self._vectors[c][size:size + n] = vectors
+        self._ids[c][size:size + n] = ids
+        self._sizes[c] = size + n
+        self._where.update(zip(ids.tolist(), ((c, row) for row in range(size, size + n))))
+
+    def _insert(self, ids, embeddings):
+        lists = assign_clusters(embeddings, self.centroids) if self.is_trained else np.zeros(len(ids), np.int64)
+        order = np.argsort(lists, kind="stable")
+        clusters, starts = np.unique(lists[order], return_index=True)
+        for c, members in zip(clusters.tolist(), np.split(order, starts[1:])):
+            self._append(c, ids[members], embeddings[members])
+
+    def add(self, ids, embeddings):
+        """Append vectors to their nearest clusters; ids that are already present are replaced."""
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove([i for i in ids.tolist() if i in self._where])
+        self._insert(ids, np.atleast_2d(l2_normalize(embeddings)))
+        if not self.is_trained and len(self) >= self.min_train_size:
+            self.train()
+
+    def remove(self, ids):
+        """Drop vectors by id (unknown ids are ignored)."""
+        for vector_id in np.asarray(ids, dtype=np.int64).tolist():
+            location = self._where.pop(vector_id, None)
+            if location is None:
+                continue
+            c, row = location
+            last = self._sizes[c] - 1
+            if row != last:
+                moved_id = int(self._ids[c][last])
+                self._vectors[c][row] = self._vectors[c][last]
+                self._ids[c][row] = moved_id
+                self._where[moved_id] = (c, row)
+            self._sizes[c] = last
+
+    def search(self, queries, k=10, nprobe=None):
+        queries = _as_queries(queries)
+        if self.is_trained:
+            probes = queries @ self.centroids.T
+            nprobe = min(nprobe or self.nprobe, self.nlist)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        ids = np.empty((len(queries), k), dtype=np.int64)
+        for q, query in enumerate(queries):
+            # Untrained: everything is in list 0 and is scanned exhaustively
+            lists = top_k(probes[q], nprobe).tolist() if self.is_trained else [0]
+            candidate_scores = np.concatenate([self._vectors[c][:self._sizes[c]] @ query for c in lists])
+            candidate_ids = np.concatenate([self._ids[c][:self._sizes[c]] for c in lists])
+            idx = top_k(candidate_scores, k)
+            scores[q], ids[q] = _pad_results(candidate_scores[idx], candidate_ids[idx], k)
+        return scores, ids
+
+
+def build_index(ids, embeddings, kind="auto", **kwargs):
+    """
+    Build a search index over embeddings.
+
+    kind is "brute", "ivf", or "auto" (IVF only once the gallery reaches MIN_IVF_SIZE).
+    Extra keyword arguments (nlist, nprobe, ...) are passed to IVFIndex.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if kind == "auto":
+        kind = "ivf" if len(embeddings) >= MIN_IVF_SIZE else "brute"
+    if kind == "brute":
+        index = BruteForceIndex(dim=embeddings.shape[1])
+    elif kind == "ivf":
+        index = IVFIndex(dim=embeddings.shape[1], **kwargs)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    index.add(ids, embeddings)
+    return index
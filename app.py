@@ -1,54 +1,297 @@
 import os
-import librosa
-import torch
+import threading
 import numpy as np
-from speechbrain.pretrained import SpeakerRecognition
-from sklearn.metrics.pairwise import cosine_similarity
+import profiling
+from audio_io import TARGET_SAMPLE_RATE, load_audio_16k
+from embedding_cache import EmbeddingCache
+from embedding_store import MODEL_DIR, EmbeddingStore, model_fingerprint
+from inference_backend import load_backend
+from score_norm import ScoreNormalizer
+from speaker_registry import SpeakerRegistry
+from vad import trim_silence
 
-# Load the pre-trained ECAPA-TDNN model
-spk_rec_model = SpeakerRecognition.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb", 
-                                                savedir="pretrained_models/spkrec-ecapa-voxceleb")
+# The pre-trained ECAPA-TDNN model is loaded on first use, so importing this module
+# stays cheap for code that only needs the enrollment store or wants to render a UI first.
+# torch, speechbrain and sklearn are only imported by the functions that need them.
+_model = None
+_model_lock = threading.Lock()
 
-# Function to extract embeddings from audio using librosa
-def get_embedding(audio_path):
-    # Load audio using librosa
-    signal, fs = librosa.load(audio_path, sr=None)
+# How the ECAPA forward pass runs: "eager" (SpeechBrain), "torchscript", "onnx", or the
+# opt-in int8 quantized "onnx-int8" for CPU-only nodes.
+# Exported backends need `python export_model.py` first (see inference_backend.py).
+EMBEDDING_BACKEND = os.environ.get("SPKREC_BACKEND", "eager")
+_backend = None
+
+# Function to get the shared model, loading it exactly once even under concurrent calls
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from speechbrain.pretrained import SpeakerRecognition
+                _model = SpeakerRecognition.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb", 
+                                                         savedir="pretrained_models/spkrec-ecapa-voxceleb")
+    return _model
+
+# Function to get the inference backend selected by EMBEDDING_BACKEND, built once
+def get_backend():
+    global _backend
+    if _backend is None:
+        model = get_model()
+        with _model_lock:
+            if _backend is None:
+                _backend = load_backend(EMBEDDING_BACKEND, model)
+    return _backend
+
+# Function for servers to pay the cold-start cost up front: loads the model and runs
+# one dummy forward pass so the first real request is not slow
+def warmup(seconds=1.0):
+    import torch
+    backend = get_backend()
+    backend.encode(torch.zeros(1, int(seconds * TARGET_SAMPLE_RATE)))
+    return backend.model
+
+# Function describing everything besides the checkpoint that changes the embeddings,
+# so cached embeddings are dropped when any of it changes
+def pipeline_id():
+    return f"sr={TARGET_SAMPLE_RATE};vad={USE_VAD};backend={EMBEDDING_BACKEND}"
+
+# Keep `app.spk_rec_model` working for existing callers, without loading at import time
+def __getattr__(name):
+    if name == "spk_rec_model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Trim leading/trailing silence and pauses before embedding (see vad.py)
+USE_VAD = True
+
+# Repeated clips are served from a cache keyed by their decoded PCM (see embedding_cache.py)
+EMBEDDING_CACHE_SIZE = 1024  # Embeddings kept in memory, 0 disables the cache
+EMBEDDING_CACHE_DIR = None  # Set to a folder to also keep cached embeddings on disk
+_embedding_cache = None
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None and EMBEDDING_CACHE_SIZE > 0:
+        _embedding_cache = EmbeddingCache(model_id=model_fingerprint(MODEL_DIR, pipeline_id()),
+                                          max_entries=EMBEDDING_CACHE_SIZE, disk_dir=EMBEDDING_CACHE_DIR)
+    return _embedding_cache
+
+# Function to decode audio to the 16 kHz mono float32 speech the model should see.
+# Returns the signal and the fraction of the clip that was kept as speech.
+def load_speech(audio, sample_rate=None, vad=None):
+    signal = load_audio_16k(audio, sample_rate)
+    if USE_VAD if vad is None else vad:
+        with profiling.stage("vad", len(signal) / TARGET_SAMPLE_RATE):
+            return trim_silence(signal, TARGET_SAMPLE_RATE)
+    return signal, 1.0
+
+# Function to decode audio to the 16 kHz mono float32 waveform the model expects.
+# Accepts a path, bytes, a file-like object (e.g. a Streamlit upload) or a NumPy
+# array; sample_rate is only needed for arrays that are not already 16 kHz.
+def load_signal(audio, sample_rate=None, vad=None):
+    signal, speech_ratio = load_speech(audio, sample_rate, vad)
+    return signal
+
+# Function to extract embeddings from audio (any input accepted by load_signal)
+def get_embedding(audio, sample_rate=None, vad=None):
+    # Decode in memory, resample to 16 kHz and drop silence, no temporary files needed
+    import torch
+    signal = load_signal(audio, sample_rate, vad)
+    
+    audio_seconds = len(signal) / TARGET_SAMPLE_RATE
+    
+    # A clip we have already seen costs one hash instead of a forward pass
+    cache = get_embedding_cache()
+    if cache is not None:
+        with profiling.stage("cache_lookup", audio_seconds):
+            key = cache.key(signal)
+            embedding = cache.get(key)
+        if embedding is not None:
+            return embedding
     
     # Convert the numpy array to a torch tensor and add a batch dimension
-    signal = torch.tensor(np.expand_dims(signal, axis=0))  # Shape: (1, waveform_length)
+    with profiling.stage("to_tensor", audio_seconds):
+        signal = torch.tensor(np.expand_dims(signal, axis=0))  # Shape: (1, waveform_length)
     
     # Get the embeddings using the model
-    embeddings = spk_rec_model.encode_batch(signal)
+    with profiling.stage("encode", audio_seconds):
+        embeddings = get_backend().encode(signal)
     
     # Return the embeddings as a numpy array
-    return embeddings.squeeze().cpu().detach().numpy()
+    embedding = embeddings.squeeze().cpu().detach().numpy()
+    if cache is not None:
+        embedding = cache.put(key, embedding)
+    return embedding
 
-# Function to register an authorized speaker (average of multiple audio samples)
-def register_authorized_speaker(authorized_folder):
-    authorized_embeddings = []
+# Function to extract embeddings for many clips at once, returns an (N, D) array.
+# Clips are sorted by length so each batch holds similar durations and needs little
+# padding; the model is told the true length of each clip through wav_lens.
+def get_embeddings(paths_or_arrays, batch_size=16, sample_rate=None, vad=None):
+    signals = [load_signal(audio, sample_rate, vad) for audio in paths_or_arrays]
+    cache = get_embedding_cache()
+    if cache is None:
+        return _encode_signals(signals, batch_size)
     
-    # Iterate over all audio files in the authorized speaker's folder
-    for file_name in os.listdir(authorized_folder):
-        file_path = os.path.join(authorized_folder, file_name)
-        embedding = get_embedding(file_path)
-        authorized_embeddings.append(embedding)
+    # Only run the model on clips that are not cached yet
+    keys = [cache.key(signal) for signal in signals]
+    cached = [cache.get(key) for key in keys]
+    todo = [i for i, embedding in enumerate(cached) if embedding is None]
+    if todo:
+        for i, embedding in zip(todo, _encode_signals([signals[i] for i in todo], batch_size)):
+            cached[i] = cache.put(keys[i], embedding)
+    if not cached:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(cached)
+
+# Function to run decoded 16 kHz signals through the model in length-sorted padded batches
+def _encode_signals(signals, batch_size):
+    import torch
+    order = sorted(range(len(signals)), key=lambda i: len(signals[i]))
+    embeddings = None
     
-    # Average the embeddings to get a single "registered" embedding for the authorized speaker
-    authorized_embedding_avg = np.mean(authorized_embeddings, axis=0)
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        lengths = np.array([len(signals[i]) for i in batch_idx])
+        max_len = lengths.max()
+        
+        audio_seconds = lengths.sum() / TARGET_SAMPLE_RATE
+        
+        # Zero-pad to the longest clip in the batch
+        with profiling.stage("to_tensor", audio_seconds):
+            batch = np.zeros((len(batch_idx), max_len), dtype=np.float32)
+            for row, i in enumerate(batch_idx):
+                batch[row, :lengths[row]] = signals[i]
+            wav_lens = torch.tensor(lengths / max_len, dtype=torch.float32)
+        
+        with profiling.stage("encode_batch", audio_seconds):
+            batch_embeddings = get_backend().encode(torch.from_numpy(batch), wav_lens)
+        batch_embeddings = batch_embeddings.squeeze(1).cpu().detach().numpy()
+        if embeddings is None:
+            embeddings = np.empty((len(signals), batch_embeddings.shape[1]), dtype=np.float32)
+        embeddings[batch_idx] = batch_embeddings
     
-    return authorized_embedding_avg
+    if embeddings is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return embeddings
 
-# Function to compare new audio sample against the registered authorized speaker's embedding
-def is_authorized_speaker(new_audio_path, authorized_embedding_avg, threshold=0.75):
-    new_embedding = get_embedding(new_audio_path)
+# Adaptive score normalization against an impostor cohort (see score_norm.py).
+# Normalized scores need their own threshold, so callers opt in by passing the normalizer.
+SCORE_NORM_COHORT = "cohort/embeddings.npy"  # Built with `python score_norm.py COHORT_DIR`
+SCORE_NORM_TOP_K = 200
+_score_normalizer = None
+
+def get_score_normalizer():
+    global _score_normalizer
+    if _score_normalizer is None:
+        _score_normalizer = ScoreNormalizer.load(SCORE_NORM_COHORT, SCORE_NORM_TOP_K,
+                                                 model_id=model_fingerprint(MODEL_DIR, pipeline_id()))
+    return _score_normalizer
+
+# Persistent cache of enrollment embeddings, created on first use
+_embedding_store = None
+
+def get_embedding_store():
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = EmbeddingStore(pipeline=pipeline_id())
+    return _embedding_store
+
+# Function to bring one speaker's enrollment in the registry in line with its folder.
+# Each file is a sample keyed by its path in the speaker's running statistics, so only
+# files that were added or changed are embedded and deleted files are subtracted out.
+# Samples from elsewhere (other folders, uploads) are left alone.
+# progress(done, total) is called as files are processed.
+def enroll_speaker(speaker_id, speaker_folder, registry, store=None, batch_size=16, progress=None):
+    if store is None:
+        store = get_embedding_store()
+    folder = os.path.abspath(speaker_folder)
+    paths = {os.path.join(folder, f) for f in os.listdir(folder)}
+    enrolled = {key for key in registry.samples(speaker_id) if os.path.dirname(key) == folder}
+    
+    for file_path in sorted(enrolled - paths):
+        registry.remove_sample(speaker_id, file_path)
+    
+    # Only run the model on files that are new or changed since the last run
+    missing = []
+    for file_path in sorted(paths):
+        embedding = store.lookup(file_path)
+        if embedding is None:
+            missing.append(file_path)
+        elif file_path not in enrolled:
+            registry.add_sample(speaker_id, file_path, embedding)
+    
+    if progress is not None:
+        progress(len(paths) - len(missing), len(paths))
     
-    # Compute cosine similarity between new embedding and the authorized speaker's embedding
-    similarity = cosine_similarity([new_embedding], [authorized_embedding_avg])[0][0]
+    # Embed everything that was not cached in batches
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        for file_path, embedding in zip(chunk, get_embeddings(chunk, batch_size=batch_size)):
+            store.put(file_path, embedding)
+            registry.add_sample(speaker_id, file_path, embedding)
+        if progress is not None:
+            progress(len(paths) - len(missing) + start + len(chunk), len(paths))
+    store.save()
+    return registry
+
+# Function to register an authorized speaker (mean direction of its normalized audio samples)
+def register_authorized_speaker(authorized_folder, store=None):
+    registry = enroll_speaker(authorized_folder, authorized_folder, SpeakerRegistry(), store)
+    if authorized_folder not in registry:
+        raise ValueError(f"No audio files in {authorized_folder}")
+    authorized_embedding_avg = registry.get(authorized_folder).copy()
     
-    print(f"Cosine Similarity: {similarity}")
+    return authorized_embedding_avg
+
+# Function to enroll every speaker in a folder, one subfolder per speaker ID.
+# Re-running it with the same registry only embeds files that changed.
+def register_speakers(speakers_folder, registry=None):
+    if registry is None:
+        registry = SpeakerRegistry()
+    for speaker_id in sorted(os.listdir(speakers_folder)):
+        speaker_folder = os.path.join(speakers_folder, speaker_id)
+        if os.path.isdir(speaker_folder) and os.listdir(speaker_folder):
+            enroll_speaker(speaker_id, speaker_folder, registry)
+    return registry
+
+# Function to compare new audio sample against the registered authorized speaker's embedding.
+# With a normalizer (app.get_score_normalizer()) the AS-norm score is compared with the
+# threshold instead of the raw cosine, so pass a threshold calibrated for it.
+def is_authorized_speaker(new_audio, authorized_embedding_avg, threshold=0.75, sample_rate=None, normalizer=None):
+    from sklearn.metrics.pairwise import cosine_similarity
+    # "verify" covers the whole request, so its time can be compared with the sum of the stages
+    with profiling.stage("verify") as timer:
+        signal, speech_ratio = load_speech(new_audio, sample_rate)
+        timer.audio(len(signal) / TARGET_SAMPLE_RATE)
+        new_embedding = get_embedding(signal, vad=False)
+        
+        # Compute cosine similarity between new embedding and the authorized speaker's embedding
+        with profiling.stage("score"):
+            similarity = cosine_similarity([new_embedding], [authorized_embedding_avg])[0][0]
+        normalized = None
+        if normalizer is not None:
+            with profiling.stage("score_norm"):
+                normalized = normalizer.score(authorized_embedding_avg, new_embedding, speaker_id="authorized")
+    
+    print(f"Cosine Similarity: {similarity} (speech ratio {speech_ratio:.2f})")
+    if normalized is not None:
+        print(f"AS-norm score: {normalized}")
+        similarity = normalized
     
     # Check if similarity is above the threshold
     if similarity >= threshold:
         return True, similarity
     else:
         return False, similarity
+
+# Function to find which enrolled speakers a new audio sample is closest to.
+# Returns the top-k (speaker_id, similarity) pairs and whether the best one passes the threshold.
+# A registry built with an ANN index (SpeakerRegistry(index=IVFIndex())) is searched through it.
+def identify_speaker(new_audio, registry, k=1, threshold=0.75, sample_rate=None):
+    new_embedding = get_embedding(new_audio, sample_rate)
+    with profiling.stage("identify"):
+        matches = registry.identify(new_embedding, k=k)
+    
+    is_known = bool(matches) and matches[0][1] >= threshold
+    return is_known, matches
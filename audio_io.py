@@ -0,0 +1,176 @@
+import io
+import math
+import os
+import wave
+from functools import lru_cache
+import numpy as np
+from profiling import stage
+
+# Constants
+TARGET_SAMPLE_RATE = 16000  # ECAPA-TDNN was trained on 16 kHz audio
+
+
+def pcm_to_float(frames, sample_width):
+    # Scale integer PCM to [-1, 1) the same way soundfile/librosa do
+    if sample_width == 1:
+        return (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    if sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        return samples.astype(np.float32) / float(1 << 23)
+    if sample_width == 4:
+        return np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+    raise wave.Error(f"Unsupported sample width: {sample_width}")
+
+
+def read_wav(fileobj):
+    """Decode a PCM WAV file (path or file-like) with the standard library; returns (signal, sample_rate)."""
+    with wave.open(fileobj, "rb") as wf:
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        signal = pcm_to_float(wf.readframes(wf.getnframes()), wf.getsampwidth())
+    if channels > 1:
+        signal = signal.reshape(-1, channels).mean(axis=1)
+    return signal, sample_rate
+
+
+def array_to_mono(signal):
+    """Convert an int or float array, mono or (frames, channels), to a mono float32 signal."""
+    signal = np.asarray(signal)
+    if np.issubdtype(signal.dtype, np.integer):
+        signal = signal.astype(np.float32) / float(np.iinfo(signal.dtype).max + 1)
+    signal = signal.astype(np.float32, copy=False)
+    if signal.ndim == 2:
+        signal = signal.mean(axis=1)
+    return signal
+
+
+def load_audio(source):
+    """
+    Decode audio to a mono float32 signal at its native rate; returns (signal, sample_rate).
+
+    ``source`` may be a path, raw bytes, a binary file-like object (e.g. a Streamlit
+    UploadedFile) or a NumPy array. PCM WAV is decoded directly in memory; anything
+    else (mp3, float WAV, ...) goes through librosa. Arrays are returned as they are,
+    with a sample rate of None.
+    """
+    if isinstance(source, np.ndarray):
+        return array_to_mono(source), None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            return read_wav(os.fspath(source))
+        except (wave.Error, EOFError):
+            pass
+    else:
+        start = source.tell()
+        try:
+            return read_wav(source)
+        except (wave.Error, EOFError):
+            source.seek(start)
+
+    import librosa
+    signal, sample_rate = librosa.load(source, sr=None, mono=True)
+    return signal, sample_rate
+
+
+@lru_cache(maxsize=16)
+def get_resampler(orig_sr, target_sr=TARGET_SAMPLE_RATE):
+    """Polyphase sinc resampler for one rate pair; the kernel is built once and cached."""
+    import torchaudio
+
+    return torchaudio.transforms.Resample(orig_freq=orig_sr, new_freq=target_sr)
+
+
+def resample(signal, orig_sr, target_sr=TARGET_SAMPLE_RATE):
+    """Resample a mono float32 signal, returning it unchanged if the rates already match."""
+    if orig_sr == target_sr:
+        return signal
+    import torch
+
+    with torch.no_grad():
+        return get_resampler(int(orig_sr), int(target_sr))(torch.from_numpy(signal)).numpy()
+
+
+class StreamResampler:
+    """
+    Resample a signal that arrives in blocks, with the same output as resampling it whole.
+
+    Resampling each block on its own zero-pads both of its edges, which leaves a click
+    at every block boundary. Here the input is cut at multiples of the polyphase period
+    (so every cut keeps the same filter phase) and each cut is resampled with enough
+    input on both sides for the sinc kernel; the output those margins produce is
+    dropped. The last ``pad`` input samples are held back until the next block or
+    ``flush`` supplies the audio after them.
+    """
+
+    def __init__(self, orig_sr, target_sr=TARGET_SAMPLE_RATE):
+        self.orig_sr, self.target_sr = int(orig_sr), int(target_sr)
+        g = math.gcd(self.orig_sr, self.target_sr)
+        self.step_in, self.step_out = self.orig_sr // g, self.target_sr // g
+        # Reach of the kernel in input samples, with slack over torchaudio's default width of 6 zero crossings
+        width = math.ceil(8 * self.step_in / min(self.step_in, self.step_out))
+        self.pad = self.step_in * (math.ceil(width / self.step_in) + 1)
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._context = 0  # leading samples of _buffer that were already resampled
+
+    def process(self, block):
+        """Resample the next block; returns the output that no longer depends on later input."""
+        block = np.asarray(block, dtype=np.float32)
+        if self.orig_sr == self.target_sr:
+            return block
+        self._buffer = np.concatenate([self._buffer, block])
+        ready = (len(self._buffer) - self._context - self.pad) // self.step_in * self.step_in
+        if ready <= 0:
+            return np.empty(0, dtype=np.float32)
+        out = resample(self._buffer[:self._context + ready + self.pad], self.orig_sr, self.target_sr)
+        skip = self._context // self.step_in * self.step_out
+        out = out[skip:skip + ready // self.step_in * self.step_out]
+        keep = max(0, self._context + ready - self.pad)
+        self._buffer = self._buffer[keep:]
+        self._context = self._context + ready - keep
+        return out
+
+    def flush(self):
+        """Resample the held-back input at the end of the signal."""
+        if self.orig_sr == self.target_sr or len(self._buffer) == self._context:
+            return np.empty(0, dtype=np.float32)
+        out = resample(self._buffer, self.orig_sr, self.target_sr)[self._context // self.step_in * self.step_out:]
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._context = 0
+        return out
+
+
+def load_audio_16k(source, sample_rate=None):
+    """
+    Canonical model front-end: decode anything load_audio accepts to 16 kHz mono float32.
+
+    ``sample_rate`` gives the rate of raw NumPy arrays; arrays without one are assumed
+    to be 16 kHz already.
+    """
+    with stage("decode") as timer:
+        signal, source_rate = load_audio(source)
+        source_rate = source_rate or sample_rate or TARGET_SAMPLE_RATE
+        timer.audio(len(signal) / source_rate)
+    with stage("resample", len(signal) / source_rate):
+        return np.ascontiguousarray(resample(signal, source_rate), dtype=np.float32)
+
+
+def to_wav_bytes(signal, sample_rate):
+    """Encode a float or int16 array, mono or (frames, channels), as 16-bit PCM WAV bytes."""
+    signal = np.asarray(signal)
+    if signal.dtype != np.int16:
+        signal = (np.clip(signal, -1.0, 1.0) * 32767).astype(np.int16)
+    channels = 1 if signal.ndim == 1 else signal.shape[1]
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(signal.tobytes())
+    return buf.getvalue()
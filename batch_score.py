@@ -0,0 +1,188 @@
+"""
+Score an archive of recordings against the enrolled speaker, in parallel.
+
+Decoding and batched embedding run in a pool of worker processes, each with its own
+model and a fixed number of torch threads. Results are appended to the output file
+as chunks finish, so an interrupted job resumes where it stopped when re-run with
+the same output path; files that failed are retried.
+
+Usage:
+    python batch_score.py ARCHIVE_DIR_OR_MANIFEST -o results.csv [--workers 4] [--threads 1]
+                          [--reference authenticated_user] [--batch-size 16] [--threshold 0.75]
+
+A manifest is a text file with one path per line, or a CSV with a ``path`` column.
+Writing ``.parquet`` needs pyarrow; rows are streamed to ``<output>.partial.csv``
+and converted when the job completes.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from audio_io import TARGET_SAMPLE_RATE
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+FIELDS = ["path", "speech_seconds", "speech_ratio", "similarity", "authorized", "error"]
+
+# Per-process state set up by _init_worker
+_reference = None
+_threshold = None
+_batch_size = None
+
+
+def list_inputs(source):
+    """Audio paths under a directory (recursively), or listed in a manifest file."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths += [os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXTENSIONS)]
+        return sorted(paths)
+    with open(source, newline="") as f:
+        first = f.readline().strip()
+        f.seek(0)
+        if first.split(",")[0] == "path":
+            return [row["path"] for row in csv.DictReader(f) if row["path"]]
+        return [line.strip() for line in f if line.strip()]
+
+
+def _init_worker(reference, threshold, batch_size, threads):
+    global _reference, _threshold, _batch_size
+    import torch
+    import app
+
+    torch.set_num_threads(threads)
+    # Archive audio is not repeated, so the embedding cache would only cost memory
+    app.EMBEDDING_CACHE_SIZE = 0
+    app.warmup()
+    _reference = reference / np.linalg.norm(reference)
+    _threshold = threshold
+    _batch_size = batch_size
+
+
+def _score_chunk(paths):
+    import app
+
+    rows, signals, ok = [], [], []
+    for path in paths:
+        try:
+            signal, speech_ratio = app.load_speech(path)
+        except Exception as e:
+            rows.append({"path": path, "error": f"{type(e).__name__}: {e}"})
+            continue
+        signals.append(signal)
+        ok.append({"path": path, "speech_seconds": round(len(signal) / TARGET_SAMPLE_RATE, 3),
+                   "speech_ratio": round(speech_ratio, 4), "error": ""})
+    if signals:
+        try:
+            embeddings = app.get_embeddings(signals, batch_size=_batch_size, vad=False)
+        except Exception as e:
+            # Record the failure against these files instead of aborting the whole job
+            for row in ok:
+                row["error"] = f"{type(e).__name__}: {e}"
+            return rows + ok
+        similarities = embeddings @ _reference / np.linalg.norm(embeddings, axis=1)
+        for row, similarity in zip(ok, similarities):
+            row["similarity"] = round(float(similarity), 6)
+            row["authorized"] = bool(similarity >= _threshold)
+    return rows + ok
+
+
+def _done_paths(csv_path):
+    """
+    Paths already scored successfully, after cleaning up an interrupted output file.
+
+    Rows that failed are dropped so they are retried, and so is a last line cut short
+    by the interruption (every complete row ends with a newline).
+    """
+    if not os.path.exists(csv_path):
+        return set()
+    with open(csv_path, newline="") as f:
+        text = f.read()
+    complete = text[:text.rfind("\n") + 1]
+    rows = list(csv.DictReader(complete.splitlines(keepends=True)))
+    # A row that lost its trailing fields reads them as None
+    kept = [row for row in rows if row.get("path") and row.get("error") == ""]
+    if complete != text or len(kept) < len(rows):
+        tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows({field: row.get(field) for field in FIELDS} for row in kept)
+        os.replace(tmp_path, csv_path)
+    return {row["path"] for row in kept}
+
+
+def _load_reference(reference):
+    if reference.endswith(".npy"):
+        return np.load(reference)
+    import app
+    return app.register_authorized_speaker(reference)
+
+
+def run(inputs, output, reference, workers, threads, batch_size, chunk_size, threshold):
+    csv_path = output if not output.endswith(".parquet") else f"{output}.partial.csv"
+    done = _done_paths(csv_path)
+    todo = [p for p in inputs if p not in done]
+    print(f"{len(inputs)} files, {len(done)} already scored, {len(todo)} to go", file=sys.stderr)
+
+    new_file = not os.path.exists(csv_path) or not os.path.getsize(csv_path)
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    start = time.perf_counter()
+    scored = 0
+    # Spawned workers do not inherit torch threads or locks the parent may already hold
+    with open(csv_path, "a", newline="") as f, ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+            initargs=(reference, threshold, batch_size, threads)) as pool:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+        # Keep a couple of chunks per worker in flight so memory stays bounded
+        pending, next_chunk = set(), 0
+        while pending or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                pending.add(pool.submit(_score_chunk, chunks[next_chunk]))
+                next_chunk += 1
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                rows = future.result()
+                writer.writerows(rows)
+                scored += len(rows)
+            f.flush()
+            elapsed = time.perf_counter() - start
+            print(f"\r{scored}/{len(todo)} files  {scored / elapsed:7.2f} files/s", end="", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"\nscored {scored} files in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.2f} files/s)", file=sys.stderr)
+
+    if output.endswith(".parquet"):
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(pyarrow.csv.read_csv(csv_path), output)
+        os.remove(csv_path)
+    return scored, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Directory of recordings or a manifest file")
+    parser.add_argument("-o", "--output", required=True, help="Results .csv or .parquet")
+    parser.add_argument("--reference", default=AUTHORIZED_USER_FOLDER,
+                        help="Enrollment folder, or a .npy file holding the reference embedding")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads per worker")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=64, help="Files handed to a worker at a time")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    args = parser.parse_args()
+
+    run(list_inputs(args.input), args.output, _load_reference(args.reference), args.workers, args.threads,
+        args.batch_size, args.chunk_size, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
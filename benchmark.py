@@ -0,0 +1,746 @@
+"""
+Offline benchmarks for the speaker recognition pipeline.
+
+Usage:
+    python benchmark.py embed [--folder authenticated_user] [--repeat 4] [--batch-size 16]
+    python benchmark.py ann [--gallery 100000] [--queries 500] [--k 10] [--nprobe 1 4 16 64]
+    python benchmark.py service [--url http://127.0.0.1:8000] [--endpoint /verify?speaker=authenticated_user]
+                                [--concurrency 8] [--requests 200]
+    python benchmark.py batching [--concurrency 16] [--requests 256] [--batch-size 16] [--batch-wait-ms 5]
+    python benchmark.py frontend [--folder authenticated_user] [--repeat 5]
+    python benchmark.py live [--file authenticated_user/<clip>.wav] [--no-realtime]
+    python benchmark.py vad [--folder authenticated_user]
+    python benchmark.py startup [--runs 3]
+    python benchmark.py cache [--folder authenticated_user]
+    python benchmark.py scaling [--files 256] [--workers 1 2 4]
+    python benchmark.py backends [--backends eager torchscript onnx] [--repeat 3]
+    python benchmark.py quantization [--baseline eager] [--quantized onnx-int8] [--impostors FOLDER]
+    python benchmark.py profile [--folder authenticated_user] [--repeat 3] [--prometheus]
+    python benchmark.py scorenorm [--cohort-size 5000] [--top-k 200] [--requests 2000]
+    python benchmark.py compact [--gallery 200000] [--queries 100] [--k 10] [--pq-m 24 48] [--rerank 10]
+    python benchmark.py sharding [--gallery 500000] [--shards 1 2 4 8] [--queries 200] [--batch 32]
+    python benchmark.py diarization [--folder authenticated_user] [--minutes 10] [--batch-size 16]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
+
+
+def list_audio_files(folder):
+    """Return the sorted paths of every file in a folder."""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+
+
+def timed(fn, *args, **kwargs):
+    """Run fn once and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def disable_embedding_cache(app):
+    """Make every call hit the model so timings compare like with like."""
+    app.EMBEDDING_CACHE_SIZE = 0
+    app._embedding_cache = None
+
+
+def bench_embed(args):
+    """Clips per second of the per-file get_embedding loop against batched get_embeddings."""
+    import app
+
+    disable_embedding_cache(app)
+    files = list_audio_files(args.folder) * args.repeat
+
+    # Warm up both paths so one-off allocations are not counted
+    app.get_embedding(files[0])
+    app.get_embeddings(files[:2], batch_size=2)
+
+    loop, loop_time = timed(lambda: np.stack([app.get_embedding(f) for f in files]))
+    batched, batched_time = timed(app.get_embeddings, files, batch_size=args.batch_size)
+
+    max_diff = np.abs(loop - batched).max()
+    print(f"clips:            {len(files)}")
+    print(f"per-file loop:    {len(files) / loop_time:8.2f} clips/s")
+    print(f"batched (bs={args.batch_size:>3}): {len(files) / batched_time:8.2f} clips/s")
+    print(f"speedup:          {loop_time / batched_time:8.2f}x")
+    print(f"max |diff|:       {max_diff:.2e}")
+
+
+def synthetic_gallery(n, dim=192, n_groups=1000, spread=0.35, seed=0):
+    """Clustered unit vectors that mimic ECAPA embeddings of many speakers."""
+    from speaker_registry import l2_normalize
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_groups, dim)).astype(np.float32)
+    groups = rng.integers(0, n_groups, n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32)
+    return l2_normalize(l2_normalize(centers[groups]) + spread * l2_normalize(noise))
+
+
+def recall_at_k(found_ids, true_ids):
+    """Fraction of the exact top-k neighbours that the approximate search returned."""
+    hits = sum(len(np.intersect1d(f, t)) for f, t in zip(found_ids, true_ids))
+    return hits / true_ids.size
+
+
+def bench_ann(args):
+    """Recall@k and queries/s of the IVF index against exhaustive cosine search."""
+    from ann_index import BruteForceIndex, IVFIndex
+    from speaker_registry import l2_normalize
+
+    # Speakers scatter widely around their group centres (cosine to the centre about 0.5),
+    # so neighbours straddle cluster borders and nprobe has a real recall/speed trade-off
+    gallery = synthetic_gallery(args.gallery, n_groups=args.groups, spread=args.spread, seed=0)
+    rng = np.random.default_rng(1)
+    # Queries are noisy re-recordings of enrolled speakers
+    picks = rng.integers(0, len(gallery), args.queries)
+    queries = l2_normalize(gallery[picks] + 0.3 * l2_normalize(rng.standard_normal(gallery[picks].shape)))
+    ids = np.arange(len(gallery))
+
+    brute = BruteForceIndex(dim=gallery.shape[1])
+    brute.add(ids, gallery)
+    true_ids, brute_time = timed(lambda: np.array([brute.search(q, args.k)[1][0] for q in queries]))
+    print(f"gallery: {len(gallery)}  queries: {len(queries)}  k: {args.k}")
+    print(f"{'brute force':>16}: recall@{args.k} 1.000  {len(queries) / brute_time:9.1f} q/s")
+
+    ivf = IVFIndex(dim=gallery.shape[1], nlist=args.nlist, min_train_size=0)
+    _, build_time = timed(ivf.add, ids, gallery)
+    print(f"{'ivf build':>16}: nlist {ivf.nlist}  {build_time:.2f}s")
+    extra = synthetic_gallery(1000, n_groups=args.groups, spread=args.spread, seed=2)
+    _, add_time = timed(lambda: [ivf.add([len(gallery) + i], vector) for i, vector in enumerate(extra)])
+    print(f"{'ivf add':>16}: {add_time / len(extra) * 1e6:.1f} us/speaker, one at a time")
+    for nprobe in args.nprobe:
+        results, ivf_time = timed(lambda: [ivf.search(q, args.k, nprobe=nprobe)[1][0] for q in queries])
+        recall = recall_at_k(results, true_ids)
+        print(f"{f'ivf nprobe={nprobe}':>16}: recall@{args.k} {recall:.3f}  {len(queries) / ivf_time:9.1f} q/s")
+
+
+async def _post(host, port, path, body):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def _load_test(host, port, path, bodies, concurrency, total):
+    latencies, statuses = [], []
+    counter = iter(range(total))
+
+    async def client():
+        for i in counter:
+            start = time.perf_counter()
+            statuses.append(await _post(host, port, path, bodies[i % len(bodies)]))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return np.array(latencies), statuses, time.perf_counter() - start
+
+
+def bench_service(args):
+    """p50/p99 latency and requests/s of a running service.py instance."""
+    from urllib.parse import urlsplit
+
+    url = urlsplit(args.url)
+    bodies = [open(f, "rb").read() for f in list_audio_files(args.folder)]
+    latencies, statuses, elapsed = asyncio.run(
+        _load_test(url.hostname, url.port or 80, args.endpoint, bodies, args.concurrency, args.requests))
+
+    errors = sum(status != 200 for status in statuses)
+    print(f"requests: {len(latencies)}  concurrency: {args.concurrency}  errors: {errors}")
+    print(f"p50:      {np.percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"p99:      {np.percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"rps:      {len(latencies) / elapsed:8.1f}")
+
+
+def _run_concurrent(embed, signals, concurrency, total):
+    """Fire total requests from concurrency threads; return (latencies, elapsed seconds)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def request(i):
+        start = time.perf_counter()
+        embed(signals[i % len(signals)])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(request, range(total))))
+    return latencies, time.perf_counter() - start
+
+
+def bench_batching(args):
+    """Throughput and p99 latency of concurrent requests with micro-batching off and on."""
+    import app
+    from micro_batcher import MicroBatcher
+
+    disable_embedding_cache(app)
+    signals = [app.load_signal(f) for f in list_audio_files(args.folder)]
+    app.get_embeddings(signals[:1])
+
+    batcher = MicroBatcher(max_batch_size=args.batch_size, max_wait_ms=args.batch_wait_ms)
+    modes = [("off", lambda s: app.get_embeddings([s], vad=False)[0]), ("on", batcher.embed)]
+    print(f"requests: {args.requests}  concurrency: {args.concurrency}")
+    for name, embed in modes:
+        latencies, elapsed = _run_concurrent(embed, signals, args.concurrency, args.requests)
+        print(f"coalescing {name:>3}: {args.requests / elapsed:8.2f} req/s  "
+              f"p50 {np.percentile(latencies, 50) * 1000:8.1f} ms  p99 {np.percentile(latencies, 99) * 1000:8.1f} ms")
+    metrics = batcher.metrics()
+    batcher.close()
+    print(f"mean batch size: {metrics['mean_batch_size']:.2f}  max queue depth: {metrics['max_queue_depth']}")
+
+
+def bench_frontend(args):
+    """Per-clip decode+resample time of the 16 kHz front-end against the librosa paths."""
+    import librosa
+    from audio_io import load_audio_16k
+
+    files = list_audio_files(args.folder)
+    paths = [
+        ("librosa sr=None (old)", lambda f: librosa.load(f, sr=None)[0]),
+        ("librosa sr=16000", lambda f: librosa.load(f, sr=16000)[0]),
+        ("load_audio_16k", load_audio_16k),
+    ]
+    print(f"clips: {len(files)} x {args.repeat}")
+    for name, load in paths:
+        load(files[0])  # builds and caches any resampling kernel
+        signals, elapsed = timed(lambda: [load(f) for _ in range(args.repeat) for f in files])
+        samples = sum(len(s) for s in signals[:len(files)])
+        print(f"{name:>22}: {elapsed / len(signals) * 1000:7.2f} ms/clip  {samples:>9} samples to the model")
+
+
+def bench_live(args):
+    """Time-to-first-decision of the live verifier replaying a WAV as a simulated microphone."""
+    import app
+    from live import LiveVerifier, replay_wav
+
+    files = list_audio_files(args.folder)
+    path = args.file or files[0]
+    authorized_embedding_avg = app.register_authorized_speaker(args.folder)
+    app.get_embedding(path)  # warm up the model
+
+    verifier = LiveVerifier(authorized_embedding_avg, window_seconds=args.window, hop_seconds=args.hop).start()
+    replay_wav(path, verifier, realtime=not args.no_realtime)
+    time.sleep(args.hop)
+    verifier.stop()
+
+    decision = verifier.latest()
+    if decision is None:
+        print("no decision made (clip shorter than min_seconds?)")
+        return
+    print(f"clip:                   {path}")
+    print(f"time to first decision: {(verifier.first_decision_at - verifier.started_at) * 1000:.0f} ms")
+    print(f"final decision:         authorized={decision.authorized} smoothed={decision.smoothed:.3f}")
+
+
+def bench_vad(args):
+    """Compute saved by VAD trimming and its effect on similarity to the enrolled centroid."""
+    import app
+    from audio_io import load_audio_16k
+    from speaker_registry import l2_normalize
+    from vad import trim_silence
+
+    disable_embedding_cache(app)
+    files = list_audio_files(args.folder)
+    signals = [load_audio_16k(f) for f in files]
+    trimmed = []
+    print(f"{'clip':>40}  {'seconds':>7}  {'speech':>6}")
+    for path, signal in zip(files, signals):
+        speech, ratio = trim_silence(signal)
+        trimmed.append(speech)
+        print(f"{os.path.basename(path):>40}  {len(signal) / 16000:7.2f}  {ratio:6.2f}")
+
+    app.get_embeddings(signals[:1], vad=False)
+    results = {}
+    for name, batch in [("full clips", signals), ("vad trimmed", trimmed)]:
+        embeddings, elapsed = timed(lambda: np.stack([app.get_embedding(s, vad=False) for s in batch]))
+        embeddings = l2_normalize(embeddings)
+        # Leave-one-out: score each clip against the centroid of the others
+        totals = embeddings.sum(axis=0)
+        scores = np.array([l2_normalize(totals - e) @ e for e in embeddings])
+        results[name] = (elapsed, scores)
+        print(f"{name:>12}: {sum(len(s) for s in batch) / 16000:7.2f} s audio  {elapsed * 1000:8.1f} ms embed  "
+              f"mean leave-one-out similarity {scores.mean():.3f}")
+
+    full_time, full_scores = results["full clips"]
+    vad_time, vad_scores = results["vad trimmed"]
+    print(f"compute saved: {(1 - vad_time / full_time) * 100:.1f}%  "
+          f"similarity change: {(vad_scores - full_scores).mean():+.3f} (min {(vad_scores - full_scores).min():+.3f})")
+
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.get_embedding({path!r})
+embedded = time.perf_counter()
+print(imported - start, embedded - start)
+"""
+
+
+def bench_startup(args):
+    """Time-to-import of app and time-to-first-embedding in a fresh interpreter."""
+    path = list_audio_files(args.folder)[0]
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT.format(path=path)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append([float(x) for x in output.split()[-2:]])
+    runs = np.array(runs)
+    print(f"runs: {args.runs} (median)")
+    print(f"time to import app:          {np.median(runs[:, 0]) * 1000:8.1f} ms")
+    print(f"time to first embedding:     {np.median(runs[:, 1]) * 1000:8.1f} ms")
+
+
+def bench_cache(args):
+    """Latency of a first (miss) and repeated (hit) get_embedding call per clip."""
+    import app
+
+    files = list_audio_files(args.folder)
+    app.warmup()
+    cold = [timed(app.get_embedding, f)[1] for f in files]
+    warm = [timed(app.get_embedding, f)[1] for f in files]
+    print(f"clips: {len(files)}")
+    print(f"first call (miss):    {np.mean(cold) * 1000:8.2f} ms/clip")
+    print(f"repeated call (hit):  {np.mean(warm) * 1000:8.2f} ms/clip (decode + hash only)")
+    print(f"cache stats:          {app.get_embedding_cache().stats()}")
+
+
+def bench_scaling(args):
+    """files/s of batch_score.py for several worker counts, to check scaling with cores."""
+    import tempfile
+    import app
+    import batch_score
+
+    files = list_audio_files(args.folder)
+    inputs = [files[i % len(files)] for i in range(args.files)]
+    reference = app.register_authorized_speaker(args.folder)
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            output = os.path.join(tmp, f"scores_{workers}.csv")
+            scored, elapsed = batch_score.run(inputs, output, reference, workers, args.threads,
+                                              args.batch_size, args.chunk_size, threshold=0.75)
+            rate = scored / elapsed
+            baseline = baseline or rate / workers
+            print(f"workers {workers:>3}: {rate:8.2f} files/s  efficiency {rate / (baseline * workers) * 100:5.1f}%")
+
+
+def bench_backends(args):
+    """Per-clip latency of the eager, TorchScript and ONNX inference backends."""
+    import app
+    from export_model import embed_all
+    from inference_backend import load_backend
+
+    model = app.get_model()
+    signals = [app.load_signal(f) for f in list_audio_files(args.folder)]
+    reference = None
+    for name in args.backends:
+        try:
+            backend = load_backend(name, model)
+        except Exception as e:
+            print(f"{name:>12}: unavailable ({type(e).__name__}: {e}); run export_model.py first")
+            continue
+        embed_all(backend, signals[:1])
+        runs = [timed(embed_all, backend, signals) for _ in range(args.repeat)]
+        embeddings = runs[0][0]
+        if reference is None:
+            reference = embeddings
+        latency = min(elapsed for _, elapsed in runs) / len(signals)
+        print(f"{name:>12}: {latency * 1000:8.2f} ms/clip  max |diff| vs {args.backends[0]} "
+              f"{np.abs(embeddings - reference).max():.2e}")
+
+
+def _model_bytes(name, model):
+    """Size of the weights a backend runs: parameters for eager, the graph file otherwise."""
+    from inference_backend import EXPORT_DIR, ONNX_FILE, ONNX_INT8_FILE, TORCHSCRIPT_FILE
+
+    if name == "eager":
+        return sum(p.numel() * p.element_size() for p in model.mods.embedding_model.parameters())
+    files = {"torchscript": TORCHSCRIPT_FILE, "onnx": ONNX_FILE, "onnx-int8": ONNX_INT8_FILE}
+    return os.path.getsize(os.path.join(EXPORT_DIR, files[name]))
+
+
+def bench_quantization(args):
+    """Speedup, model size and score drift of the int8 quantized backend against float32."""
+    import app
+    from evaluate import synthetic_impostors
+    from export_model import embed_all
+    from inference_backend import load_backend
+    from speaker_registry import l2_normalize
+
+    model = app.get_model()
+    genuine = [app.load_signal(f) for f in list_audio_files(args.folder)]
+    if args.impostors:
+        impostors = [app.load_signal(f) for f in list_audio_files(args.impostors)]
+    else:
+        impostors = synthetic_impostors(genuine)
+    print(f"genuine clips: {len(genuine)}  impostor clips: {len(impostors)}"
+          f"{'' if args.impostors else ' (synthetic, pitch-shifted)'}")
+
+    results = {}
+    for name in (args.baseline, args.quantized):
+        backend = load_backend(name, model)
+        embed_all(backend, genuine[:1])
+        runs = [timed(embed_all, backend, genuine) for _ in range(args.repeat)]
+        enrolled = l2_normalize(runs[0][0])
+        # Genuine trials score each clip against the centroid of the others (leave-one-out)
+        totals = enrolled.sum(axis=0)
+        genuine_scores = np.array([l2_normalize(totals - e) @ e for e in enrolled])
+        impostor_scores = l2_normalize(embed_all(backend, impostors)) @ l2_normalize(totals)
+        latency = min(elapsed for _, elapsed in runs) / len(genuine)
+        results[name] = (latency, genuine_scores, impostor_scores, enrolled)
+        print(f"{name:>12}: {latency * 1000:8.2f} ms/clip  weights {_model_bytes(name, model) / 2**20:6.2f} MiB  "
+              f"genuine {genuine_scores.mean():.3f}  impostor {impostor_scores.mean():.3f}")
+
+    base_latency, base_genuine, base_impostor, base_enrolled = results[args.baseline]
+    latency, genuine_scores, impostor_scores, enrolled = results[args.quantized]
+    drift = np.concatenate([genuine_scores - base_genuine, impostor_scores - base_impostor])
+    flips = np.concatenate([(genuine_scores >= args.threshold) != (base_genuine >= args.threshold),
+                            (impostor_scores >= args.threshold) != (base_impostor >= args.threshold)])
+    print(f"speedup:             {base_latency / latency:6.2f}x")
+    print(f"embedding cosine:    min {np.sum(enrolled * base_enrolled, axis=1).min():.4f}")
+    print(f"score drift:         mean {drift.mean():+.4f}  max |drift| {np.abs(drift).max():.4f}")
+    print(f"decision flips @{args.threshold}: {flips.sum()} of {flips.size} trials")
+
+
+def bench_profile(args):
+    """Where the time of is_authorized_speaker goes, stage by stage, and what profiling costs."""
+    import app
+    import profiling
+
+    disable_embedding_cache(app)
+    files = list_audio_files(args.folder)
+    reference = app.register_authorized_speaker(args.folder)
+    app.is_authorized_speaker(files[0], reference)
+
+    elapsed = {}
+    for enabled in (False, True):
+        profiling.enable(enabled)
+        profiling.reset()
+        _, elapsed[enabled] = timed(lambda: [app.is_authorized_speaker(f, reference)
+                                             for _ in range(args.repeat) for f in files])
+    profiling.enable(False)
+
+    stages = profiling.snapshot()
+    total = stages["verify"]["seconds"]
+    print(f"\n{'stage':>14} {'calls':>6} {'mean ms':>9} {'share':>6} {'x real time':>11}")
+    for name, s in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        speed = f"{1 / s['realtime_factor']:11.1f}" if s["realtime_factor"] else f"{'':>11}"
+        print(f"{name:>14} {s['calls']:>6} {s['mean_ms']:9.2f} {s['seconds'] / total * 100:5.1f}% {speed}")
+    print(f"profiling overhead: {(elapsed[True] / elapsed[False] - 1) * 100:+.1f}% wall time")
+    if args.prometheus:
+        print(profiling.render_prometheus())
+
+
+def bench_scorenorm(args):
+    """Per-request cost of AS-norm with cached speaker statistics, against raw cosine scoring."""
+    import tempfile
+    from score_norm import ScoreNormalizer
+    from speaker_registry import SpeakerRegistry, l2_normalize
+
+    gallery = synthetic_gallery(args.cohort_size + args.speakers, seed=0)
+    rng = np.random.default_rng(1)
+    registry = SpeakerRegistry()
+    for i, centroid in enumerate(gallery[args.cohort_size:]):
+        registry.add(f"speaker{i}", centroid)
+    picks = rng.integers(0, args.speakers, args.requests)
+    queries = l2_normalize(gallery[args.cohort_size + picks] + 0.3 * l2_normalize(
+        rng.standard_normal((args.requests, gallery.shape[1]))))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Memory-mapped like a real cohort file
+        path = os.path.join(tmp, "cohort.npy")
+        np.save(path, gallery[:args.cohort_size])
+        normalizer = ScoreNormalizer.load(path, args.top_k)
+        _, cold = timed(lambda: [normalizer.speaker_stats(s, registry.get(s)) for s in registry.speakers])
+        _, raw_time = timed(lambda: [registry.score(f"speaker{p}", q) for p, q in zip(picks, queries)])
+        _, norm_time = timed(lambda: [normalizer.score(registry.get(f"speaker{p}"), q, f"speaker{p}")
+                                      for p, q in zip(picks, queries)])
+        del normalizer
+    print(f"cohort: {args.cohort_size}  top-k: {args.top_k}  speakers: {args.speakers}  requests: {args.requests}")
+    print(f"speaker stats (once):  {cold / args.speakers * 1e6:8.1f} us/speaker")
+    print(f"raw cosine:            {raw_time / args.requests * 1e6:8.1f} us/request")
+    print(f"AS-norm (cached):      {norm_time / args.requests * 1e6:8.1f} us/request")
+
+
+def bench_compact(args):
+    """Memory, scan queries/s, score error and recall@k of float16 and PQ stores against float32."""
+    import tempfile
+    from compact_store import CompactEmbeddings
+    from speaker_registry import l2_normalize
+
+    gallery = synthetic_gallery(args.gallery, seed=0)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(gallery), args.queries)
+    queries = l2_normalize(gallery[picks] + 0.3 * l2_normalize(rng.standard_normal(gallery[picks].shape)))
+    ids = np.arange(len(gallery))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The float32 baseline is memory-mapped too, so every row scans from the page cache
+        path = os.path.join(tmp, "float32.npy")
+        np.save(path, gallery)
+        baseline = np.load(path, mmap_mode="r")
+        exact, base_time = timed(lambda: queries @ baseline.T)
+        true_ids = np.argsort(-exact, axis=1)[:, :args.k]
+        print(f"gallery: {len(gallery)}  dim: {gallery.shape[1]}  queries: {len(queries)}  k: {args.k}")
+        print(f"{'store':>16} {'bytes/vec':>10} {'MiB':>8} {'build s':>8} {'q/s':>9} "
+              f"{'mean |err|':>11} {'max |err|':>10} {f'recall@{args.k}':>10}")
+        print(f"{'float32':>16} {baseline.nbytes / len(gallery):10.0f} {baseline.nbytes / 2 ** 20:8.1f} "
+              f"{'-':>8} {len(queries) / base_time:9.1f} {0:11.5f} {0:10.5f} {1:10.3f}")
+
+        def report(name, store, build_time, rerank=None):
+            (_, found_ids), scan_time = timed(store.search, queries, args.k, rerank)
+            errors = np.abs(np.stack([store.scores(q) for q in queries[:10]]) - exact[:10])
+            print(f"{name:>16} {store.nbytes / len(gallery):10.0f} {store.nbytes / 2 ** 20:8.1f} "
+                  f"{build_time:8.2f} {len(queries) / scan_time:9.1f} {errors.mean():11.5f} {errors.max():10.5f} "
+                  f"{recall_at_k(found_ids, true_ids):10.3f}")
+
+        def build(name, kind, **kwargs):
+            store = CompactEmbeddings.create(os.path.join(tmp, name), kind, gallery.shape[1], **kwargs)
+            store.append(ids, gallery)
+            return store
+
+        store, build_time = timed(build, "float16", "float16")
+        report("float16", store, build_time)
+        for m in args.pq_m:
+            # The float16 copy is only read for re-ranked candidates; the scan touches codes only
+            store, build_time = timed(build, f"pq{m}", "pq", m=m, train=gallery[:args.train], rerank=True)
+            report(f"pq m={m}", store, build_time)
+            report(f"pq m={m} +rerank", store, build_time, args.rerank)
+        del store
+        del baseline
+
+
+def bench_sharding(args):
+    """Identification latency of the sharded multi-process registry against shard count."""
+    from sharded_registry import ShardedRegistry
+    from speaker_registry import SpeakerRegistry, l2_normalize, top_k
+
+    gallery = synthetic_gallery(args.gallery, seed=0)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(gallery), args.queries)
+    queries = l2_normalize(gallery[picks] + 0.3 * l2_normalize(rng.standard_normal(gallery[picks].shape)))
+    registry = SpeakerRegistry(capacity=len(gallery))
+    for i, centroid in enumerate(gallery):
+        registry.add(i, centroid)
+    del gallery
+
+    def report(name, identify, search):
+        identify(queries[0], args.k)
+        latencies = np.array([timed(identify, q, args.k)[1] for q in queries]) * 1000
+        _, batch_time = timed(lambda: [search(queries[i:i + args.batch], args.k)
+                                       for i in range(0, len(queries), args.batch)])
+        print(f"{name:>14}: p50 {np.percentile(latencies, 50):7.2f} ms  p95 {np.percentile(latencies, 95):7.2f} ms  "
+              f"batched {len(queries) / batch_time:9.1f} q/s")
+
+    def search(batch, k):
+        # One GEMM per batch, as each shard does for its slice
+        scores = l2_normalize(batch) @ registry.centroids.T
+        speakers = registry.speakers
+        return [[(speakers[i], float(row[i])) for i in top_k(row, k)] for row in scores]
+
+    print(f"gallery: {len(registry)}  queries: {len(queries)}  k: {args.k}  batch: {args.batch}  "
+          f"cpus: {os.cpu_count()}")
+    report("in-process", registry.identify, search)
+    for num_shards in args.shards:
+        sharded = ShardedRegistry.from_registry(registry, num_shards)
+        with sharded:
+            report(f"{num_shards} shard(s)", sharded.identify, sharded.search)
+
+
+def bench_diarization(args):
+    """Audio-hours diarized per CPU-hour, stage by stage, on a synthetic conversation."""
+    import app
+    import profiling
+    from audio_io import TARGET_SAMPLE_RATE
+    from diarization import diarize, speaker_time
+    from evaluate import pitch_shift
+    from speaker_registry import SpeakerRegistry
+
+    disable_embedding_cache(app)
+    registry = SpeakerRegistry()
+    registry.add(args.folder, app.register_authorized_speaker(args.folder))
+    clips = [app.load_signal(f) for f in list_audio_files(args.folder)]
+
+    # Turns alternate at random between the enrolled speaker and pitch-shifted stand-ins for others
+    rng = np.random.default_rng(0)
+    pause = np.zeros(int(args.pause * TARGET_SAMPLE_RATE), dtype=np.float32)
+    turns, enrolled_seconds, total = [], 0.0, 0
+    while total < args.minutes * 60 * TARGET_SAMPLE_RATE:
+        clip = clips[rng.integers(len(clips))]
+        speaker = rng.integers(len(args.factors) + 1)
+        if speaker:
+            clip = pitch_shift(clip, args.factors[speaker - 1])
+        else:
+            enrolled_seconds += len(clip) / TARGET_SAMPLE_RATE
+        turns += [clip, pause]
+        total += len(clip) + len(pause)
+    recording = np.concatenate(turns)
+    audio_seconds = len(recording) / TARGET_SAMPLE_RATE
+
+    diarize(recording[:30 * TARGET_SAMPLE_RATE], registry, batch_size=args.batch_size)
+    profiling.enable()
+    profiling.reset()
+    cpu_start = time.process_time()
+    (spans, _), wall = timed(diarize, recording, registry, batch_size=args.batch_size,
+                             num_speakers=args.num_speakers)
+    cpu = time.process_time() - cpu_start
+    profiling.enable(False)
+
+    print(f"audio: {audio_seconds / 60:.1f} min  speakers: {len(args.factors) + 1}  spans: {len(spans)}  "
+          f"clusters: {len({span.cluster for span in spans})}")
+    print(f"throughput: {audio_seconds / cpu:.1f} audio-hours per CPU-hour  {audio_seconds / wall:.1f}x real time")
+    print(f"\n{'stage':>16} {'seconds':>8} {'share':>6}")
+    for name, s in profiling.snapshot().items():
+        if name.startswith("diarize_"):
+            print(f"{name:>16} {s['seconds']:8.2f} {s['seconds'] / wall * 100:5.1f}%")
+    found = speaker_time(spans).get(args.folder, 0.0)
+    print(f"\n{args.folder}: {found:.1f}s attributed, {enrolled_seconds:.1f}s spoken")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embed = subparsers.add_parser("embed", help=bench_embed.__doc__)
+    embed.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    embed.add_argument("--repeat", type=int, default=4, help="Repeat the folder to get more clips")
+    embed.add_argument("--batch-size", type=int, default=16)
+    embed.set_defaults(func=bench_embed)
+
+    ann = subparsers.add_parser("ann", help=bench_ann.__doc__)
+    ann.add_argument("--gallery", type=int, default=100000, help="Number of enrolled speakers")
+    ann.add_argument("--queries", type=int, default=500)
+    ann.add_argument("--k", type=int, default=10)
+    ann.add_argument("--nlist", type=int, default=None, help="IVF clusters (default 4*sqrt(gallery))")
+    ann.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    ann.add_argument("--groups", type=int, default=1000, help="Clusters of similar speakers in the gallery")
+    ann.add_argument("--spread", type=float, default=1.7, help="Noise around group centres (1.7: cosine ~0.5)")
+    ann.set_defaults(func=bench_ann)
+
+    service = subparsers.add_parser("service", help=bench_service.__doc__)
+    service.add_argument("--url", default="http://127.0.0.1:8000")
+    service.add_argument("--endpoint", default="/verify?speaker=authenticated_user")
+    service.add_argument("--folder", default=AUTHORIZED_USER_FOLDER, help="Clips sent as request bodies")
+    service.add_argument("--concurrency", type=int, default=8)
+    service.add_argument("--requests", type=int, default=200)
+    service.set_defaults(func=bench_service)
+
+    batching = subparsers.add_parser("batching", help=bench_batching.__doc__)
+    batching.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    batching.add_argument("--concurrency", type=int, default=16)
+    batching.add_argument("--requests", type=int, default=256)
+    batching.add_argument("--batch-size", type=int, default=16)
+    batching.add_argument("--batch-wait-ms", type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    frontend = subparsers.add_parser("frontend", help=bench_frontend.__doc__)
+    frontend.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    frontend.add_argument("--repeat", type=int, default=5)
+    frontend.set_defaults(func=bench_frontend)
+
+    live = subparsers.add_parser("live", help=bench_live.__doc__)
+    live.add_argument("--folder", default=AUTHORIZED_USER_FOLDER, help="Enrollment clips")
+    live.add_argument("--file", default=None, help="Clip to replay (default: first enrollment clip)")
+    live.add_argument("--window", type=float, default=2.0)
+    live.add_argument("--hop", type=float, default=0.5)
+    live.add_argument("--no-realtime", action="store_true", help="Feed the clip as fast as possible")
+    live.set_defaults(func=bench_live)
+
+    vad = subparsers.add_parser("vad", help=bench_vad.__doc__)
+    vad.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    vad.set_defaults(func=bench_vad)
+
+    startup = subparsers.add_parser("startup", help=bench_startup.__doc__)
+    startup.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    startup.add_argument("--runs", type=int, default=3)
+    startup.set_defaults(func=bench_startup)
+
+    cache = subparsers.add_parser("cache", help=bench_cache.__doc__)
+    cache.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    cache.set_defaults(func=bench_cache)
+
+    scaling = subparsers.add_parser("scaling", help=bench_scaling.__doc__)
+    scaling.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    scaling.add_argument("--files", type=int, default=256)
+    scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    scaling.add_argument("--threads", type=int, default=1)
+    scaling.add_argument("--batch-size", type=int, default=16)
+    scaling.add_argument("--chunk-size", type=int, default=16)
+    scaling.set_defaults(func=bench_scaling)
+
+    backends = subparsers.add_parser("backends", help=bench_backends.__doc__)
+    backends.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    backends.add_argument("--backends", nargs="+", default=["eager", "torchscript", "onnx"])
+    backends.add_argument("--repeat", type=int, default=3)
+    backends.set_defaults(func=bench_backends)
+
+    quantization = subparsers.add_parser("quantization", help=bench_quantization.__doc__)
+    quantization.add_argument("--folder", default=AUTHORIZED_USER_FOLDER, help="Genuine clips")
+    quantization.add_argument("--impostors", default=None,
+                              help="Folder of held-out impostor clips (default: pitch-shifted genuine clips)")
+    quantization.add_argument("--baseline", default="eager")
+    quantization.add_argument("--quantized", default="onnx-int8")
+    quantization.add_argument("--threshold", type=float, default=0.75)
+    quantization.add_argument("--repeat", type=int, default=3)
+    quantization.set_defaults(func=bench_quantization)
+
+    profile = subparsers.add_parser("profile", help=bench_profile.__doc__)
+    profile.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    profile.add_argument("--repeat", type=int, default=3)
+    profile.add_argument("--prometheus", action="store_true", help="Also print the Prometheus exposition")
+    profile.set_defaults(func=bench_profile)
+
+    scorenorm = subparsers.add_parser("scorenorm", help=bench_scorenorm.__doc__)
+    scorenorm.add_argument("--cohort-size", type=int, default=5000)
+    scorenorm.add_argument("--top-k", type=int, default=200)
+    scorenorm.add_argument("--speakers", type=int, default=100)
+    scorenorm.add_argument("--requests", type=int, default=2000)
+    scorenorm.set_defaults(func=bench_scorenorm)
+
+    compact = subparsers.add_parser("compact", help=bench_compact.__doc__)
+    compact.add_argument("--gallery", type=int, default=200000, help="Number of stored embeddings")
+    compact.add_argument("--queries", type=int, default=100)
+    compact.add_argument("--k", type=int, default=10)
+    compact.add_argument("--pq-m", type=int, nargs="+", default=[24, 48], help="PQ sub-vectors (bytes per vector)")
+    compact.add_argument("--train", type=int, default=20000, help="Embeddings the PQ codebooks are trained on")
+    compact.add_argument("--rerank", type=int, default=10, help="PQ candidates re-scored from float16, per k")
+    compact.set_defaults(func=bench_compact)
+
+    sharding = subparsers.add_parser("sharding", help=bench_sharding.__doc__)
+    sharding.add_argument("--gallery", type=int, default=500000, help="Number of enrolled speakers")
+    sharding.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    sharding.add_argument("--queries", type=int, default=200)
+    sharding.add_argument("--k", type=int, default=10)
+    sharding.add_argument("--batch", type=int, default=32, help="Queries scattered together in the batched run")
+    sharding.set_defaults(func=bench_sharding)
+
+    diarization = subparsers.add_parser("diarization", help=bench_diarization.__doc__)
+    diarization.add_argument("--folder", default=AUTHORIZED_USER_FOLDER)
+    diarization.add_argument("--minutes", type=float, default=10.0, help="Length of the synthetic conversation")
+    diarization.add_argument("--factors", type=float, nargs="+", default=[0.8, 1.25],
+                             help="Pitch factors of the other speakers")
+    diarization.add_argument("--pause", type=float, default=0.5, help="Silence between turns, in seconds")
+    diarization.add_argument("--num-speakers", type=int, default=None)
+    diarization.add_argument("--batch-size", type=int, default=16)
+    diarization.set_defaults(func=bench_diarization)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
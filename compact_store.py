@@ -0,0 +1,276 @@
+"""
+Compact, memory-mapped storage for very large numbers of L2-normalized embeddings.
+
+``float16`` halves the footprint of float32 with score errors around 1e-3. ``pq``
+(product quantization) splits each vector into ``m`` sub-vectors and stores the index
+of the nearest of 256 trained centroids for each, so a 192-dim embedding takes ``m``
+bytes (24 by default, 32x smaller than float32). Queries are scored by asymmetric
+distance computation (ADC): the query stays in float32, its inner product with every
+centroid is tabulated once, and each stored vector's score is a sum of ``m`` table
+lookups. PQ scores are coarse (errors of a few hundredths), so a PQ store can keep a
+float16 copy on disk that only the best candidates are re-scored from.
+
+A store is a directory of ``.npy`` segments that are opened with ``mmap_mode="r"``,
+so any number of worker processes scanning the same store share one copy in the
+page cache. ``append`` adds a new segment and never rewrites existing ones. Search
+returns ``(scores, ids)`` arrays of shape ``(num_queries, k)`` like ann_index.
+"""
+import json
+import os
+import numpy as np
+from speaker_registry import l2_normalize
+
+# Constants
+KINDS = ("float16", "pq")
+META_NAME = "meta.json"
+CODEBOOK_NAME = "codebook.npy"
+PQ_CENTROIDS = 256  # One byte per sub-vector code
+SCAN_CHUNK = 65536  # Vectors scored per step, bounds temporary memory
+
+
+def kmeans(vectors, n_clusters, n_iter=15, seed=0):
+    """Euclidean k-means; returns (n_clusters, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=len(vectors) < n_clusters)].copy()
+    for _ in range(n_iter):
+        # argmin ||x - c||^2 == argmin ||c||^2 - 2 x.c
+        assign = np.argmin(np.sum(centroids ** 2, axis=1) - 2 * vectors @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        clusters, starts, counts = np.unique(assign[order], return_index=True, return_counts=True)
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        # Clusters that lost every member keep their previous centroid
+        centroids[clusters] = sums / counts[:, None]
+    return centroids
+
+
+class ProductQuantizer:
+    """Splits vectors into ``m`` sub-vectors, each encoded as one byte."""
+
+    def __init__(self, dim=192, m=24, codebook=None):
+        if dim % m:
+            raise ValueError(f"dim {dim} is not divisible by m {m}")
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        # (m, PQ_CENTROIDS, dsub) centroids of every subspace
+        self.codebook = codebook
+
+    def train(self, vectors, n_iter=15, seed=0):
+        vectors = l2_normalize(vectors)
+        self.codebook = np.stack([
+            kmeans(vectors[:, j * self.dsub:(j + 1) * self.dsub], PQ_CENTROIDS, n_iter, seed + j)
+            for j in range(self.m)
+        ])
+        return self
+
+    def encode(self, vectors):
+        """(n, dim) vectors -> (m, n) uint8 codes, one contiguous row per subspace."""
+        vectors = l2_normalize(vectors)
+        codes = np.empty((self.m, len(vectors)), dtype=np.uint8)
+        norms = np.sum(self.codebook ** 2, axis=2)
+        for j in range(self.m):
+            sub = vectors[:, j * self.dsub:(j + 1) * self.dsub]
+            for start in range(0, len(sub), SCAN_CHUNK):
+                chunk = sub[start:start + SCAN_CHUNK]
+                codes[j, start:start + len(chunk)] = np.argmin(norms[j] - 2 * chunk @ self.codebook[j].T, axis=1)
+        return codes
+
+    def decode(self, codes):
+        """(m, n) codes -> (n, dim) approximate vectors."""
+        return np.concatenate([self.codebook[j][codes[j]] for j in range(self.m)], axis=1)
+
+    def inner_product_tables(self, queries):
+        """(m, PQ_CENTROIDS, num_queries) inner products of query sub-vectors with their subspace's centroids."""
+        sub = np.atleast_2d(l2_normalize(queries)).reshape(-1, self.m, self.dsub)
+        return np.ascontiguousarray(np.einsum("qjd,jcd->jcq", sub, self.codebook))
+
+    def adc_scores(self, tables, codes):
+        """(num_queries, n) approximate inner products of the tabulated queries with the coded vectors."""
+        # One gathered row holds a code's table entry for every query, so the index
+        # arrays are walked once per subspace however many queries are batched
+        scores = tables[0][codes[0]]
+        for j in range(1, self.m):
+            scores += tables[j][codes[j]]
+        return scores.T
+
+
+class CompactEmbeddings:
+    """
+    Append-only, memory-mapped float16 or product-quantized embedding store.
+
+    A ``pq`` store created with ``rerank=True`` also keeps a float16 copy of every
+    vector on disk. ``search(..., rerank=r)`` then scans only the codes and re-scores
+    the best ``k * r`` candidates from the float16 copy, so only their pages are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_NAME)) as f:
+            meta = json.load(f)
+        self.kind = meta["kind"]
+        self.dim = meta["dim"]
+        self.rerankable = self.kind == "float16" or meta.get("rerank", False)
+        self.pq = None
+        if self.kind == "pq":
+            self.pq = ProductQuantizer(self.dim, meta["m"], np.load(os.path.join(path, CODEBOOK_NAME)))
+        self._segments = []
+        self._vectors = []
+        self._ids = None  # concatenated ids of all segments, built on first use
+        for i in range(meta["segments"]):
+            self._open_segment(i)
+
+    @classmethod
+    def create(cls, path, kind="float16", dim=192, m=24, train=None, rerank=False, n_iter=15, seed=0):
+        """
+        Create an empty store at ``path``.
+
+        ``pq`` needs ``train``, a representative sample of embeddings (tens of thousands
+        is plenty) to learn the codebook from.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown compact store kind {kind!r}, expected one of {KINDS}")
+        os.makedirs(path, exist_ok=True)
+        meta = {"kind": kind, "dim": dim, "segments": 0}
+        if kind == "pq":
+            if train is None:
+                raise ValueError("A product-quantized store needs training embeddings")
+            np.save(os.path.join(path, CODEBOOK_NAME), ProductQuantizer(dim, m).train(train, n_iter, seed).codebook)
+            meta["m"] = m
+            meta["rerank"] = rerank
+        _write_json(os.path.join(path, META_NAME), meta)
+        return cls(path)
+
+    def _segment_path(self, i, part):
+        return os.path.join(self.path, f"seg-{i:05d}.{part}.npy")
+
+    def _open_segment(self, i):
+        ids = np.load(self._segment_path(i, "ids"), mmap_mode="r")
+        data = np.load(self._segment_path(i, "data"), mmap_mode="r")
+        self._segments.append((ids, data))
+        self._ids = None
+        if self.kind == "float16":
+            self._vectors.append(data)
+        elif self.rerankable:
+            self._vectors.append(np.load(self._segment_path(i, "f16"), mmap_mode="r"))
+
+    def __len__(self):
+        return sum(len(ids) for ids, _ in self._segments)
+
+    @property
+    def nbytes(self):
+        """Bytes of the data that is scanned (excluding ids, codebook and re-ranking copy)."""
+        return sum(data.nbytes for _, data in self._segments)
+
+    def append(self, ids, embeddings):
+        """Encode and store embeddings as a new segment."""
+        embeddings = l2_normalize(embeddings)
+        parts = {"ids": np.asarray(ids, dtype=np.int64)}
+        if self.kind == "pq":
+            parts["data"] = self.pq.encode(embeddings)
+            if self.rerankable:
+                parts["f16"] = embeddings.astype(np.float16)
+        else:
+            parts["data"] = embeddings.astype(np.float16)
+        i = len(self._segments)
+        for part, array in parts.items():
+            target = self._segment_path(i, part)
+            tmp_path = f"{target}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, target)
+        self._open_segment(i)
+        meta_path = os.path.join(self.path, META_NAME)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["segments"] = len(self._segments)
+        _write_json(meta_path, meta)
+
+    def ids(self):
+        """Ids of all stored vectors in storage order (read-only, cached until the next append)."""
+        if self._ids is None:
+            ids = np.concatenate([ids for ids, _ in self._segments]) if self._segments else np.empty(0, dtype=np.int64)
+            ids.setflags(write=False)
+            self._ids = ids
+        return self._ids
+
+    def reconstruct(self):
+        """Every stored vector as float32, in storage order (for checks, not for scanning)."""
+        parts = [self.pq.decode(data) if self.pq else np.asarray(data, dtype=np.float32) for _, data in self._segments]
+        return np.concatenate(parts) if parts else np.empty((0, self.dim), dtype=np.float32)
+
+    def _chunks(self):
+        """(first row, data chunk) over all segments."""
+        offset = 0
+        for _, data in self._segments:
+            n = data.shape[1] if self.pq else len(data)
+            for start in range(0, n, SCAN_CHUNK):
+                yield offset + start, (data[:, start:start + SCAN_CHUNK] if self.pq else data[start:start + SCAN_CHUNK])
+            offset += n
+
+    def _chunk_scores(self, queries, tables, chunk):
+        if self.pq:
+            return self.pq.adc_scores(tables, chunk)
+        return queries @ chunk.astype(np.float32).T
+
+    def scores(self, query):
+        """Approximate cosine of one query with every stored vector, in storage order."""
+        query = np.atleast_2d(l2_normalize(query))
+        tables = self.pq.inner_product_tables(query) if self.pq else None
+        parts = [self._chunk_scores(query, tables, chunk)[0] for _, chunk in self._chunks()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+
+    def _gather(self, rows):
+        """Float16 copies of the given global rows, as float32."""
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        offset = 0
+        for vectors in self._vectors:
+            mask = (rows >= offset) & (rows < offset + len(vectors))
+            out[mask] = vectors[rows[mask] - offset]
+            offset += len(vectors)
+        return out
+
+    def search(self, queries, k=10, rerank=None):
+        """
+        Top-k ids by approximate cosine; scans every chunk once for all queries.
+
+        ``rerank`` (pq stores created with ``rerank=True``) re-scores the best
+        ``k * rerank`` ADC candidates of each query from the float16 copy.
+        """
+        queries = np.atleast_2d(l2_normalize(queries))
+        if rerank and not (self.pq and self.rerankable):
+            raise ValueError("rerank needs a pq store created with rerank=True")
+        n_candidates = k * rerank if rerank else k
+        tables = self.pq.inner_product_tables(queries) if self.pq else None
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for first_row, chunk in self._chunks():
+            scores = self._chunk_scores(queries, tables, chunk)
+            rows = np.broadcast_to(np.arange(first_row, first_row + scores.shape[1]), scores.shape)
+            best_scores, best_rows = _keep_best(np.concatenate([best_scores, scores], axis=1),
+                                                np.concatenate([best_rows, rows], axis=1), n_candidates)
+        if rerank:
+            candidates = self._gather(best_rows.ravel()).reshape(*best_rows.shape, self.dim)
+            best_scores, best_rows = _keep_best(np.einsum("qcd,qd->qc", candidates, queries), best_rows, k)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores[:, :best_scores.shape[1]] = best_scores
+        out_ids[:, :best_rows.shape[1]] = self.ids()[best_rows]
+        return out_scores, out_ids
+
+
+def _keep_best(scores, rows, k):
+    """The k highest scores of each row (unordered) and their row numbers."""
+    if scores.shape[1] <= k:
+        return scores, rows
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, idx, axis=1), np.take_along_axis(rows, idx, axis=1)
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,241 @@
+"""
+Who spoke when: segment-level diarization of multi-party recordings.
+
+``is_authorized_speaker`` embeds a whole file, so a recording in which the enrolled
+speaker talks for a minute out of ten gets one diluted score. ``diarize`` instead
+finds the speech regions with the energy VAD (or takes the whole recording if it
+finds none), cuts them into overlapping windows, embeds all windows in padded
+batches, and groups them with average-linkage agglomerative clustering on cosine
+similarity. Each cluster's centroid is then scored against the enrolled speakers;
+clusters that match none are reported as unknown speakers. Every window owns the
+audio up to halfway to its neighbours, and runs of windows with the same cluster
+become the reported spans.
+
+Clustering keeps an (N, N) similarity matrix of the N windows (about 90 MB for an
+hour of audio at the default hop) and each merge only rescans the rows whose nearest
+cluster changed, so it is vectorized per merge rather than cubic.
+
+Usage:
+    python diarization.py RECORDING [--authorized-folder authenticated_user] [--speakers-folder DIR]
+                          [--num-speakers N] [--cluster-threshold 0.45] [--threshold 0.75] [-o spans.json]
+"""
+import argparse
+import json
+from collections import namedtuple
+import numpy as np
+import profiling
+from audio_io import TARGET_SAMPLE_RATE, load_audio_16k
+from speaker_registry import SpeakerRegistry, l2_normalize
+from vad import speech_segments
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
+WINDOW_SECONDS = 1.5  # Audio per embedded window
+HOP_SECONDS = 0.75  # Step between windows inside a speech region
+MIN_SECONDS = 0.5  # Speech regions shorter than this are not attributed
+CLUSTER_THRESHOLD = 0.45  # Stop merging when no two clusters average above this cosine
+MAX_GAP_SECONDS = 0.5  # Pauses shorter than this do not split a speaker's span
+
+
+class Span(namedtuple("Span", "start end cluster speaker similarity")):
+    """
+    Seconds ``start``-``end`` spoken by ``cluster``; ``speaker`` is the enrolled speaker it
+    was attributed to (None if unknown) and ``similarity`` the cluster's cosine with it.
+    """
+
+    __slots__ = ()
+
+    @property
+    def label(self):
+        return self.speaker if self.speaker is not None else f"unknown-{self.cluster}"
+
+
+def speech_windows(signal, sample_rate=TARGET_SAMPLE_RATE, window_seconds=WINDOW_SECONDS,
+                   hop_seconds=HOP_SECONDS, min_seconds=MIN_SECONDS, segments=None):
+    """
+    (start, end) sample ranges of overlapping windows covering every speech region.
+
+    ``segments`` overrides the regions found by the VAD.
+    """
+    window, hop = int(window_seconds * sample_rate), int(hop_seconds * sample_rate)
+    if segments is None:
+        segments = speech_segments(signal, sample_rate)
+    windows = []
+    for start, end in segments:
+        length = end - start
+        if length < min_seconds * sample_rate:
+            continue
+        if length <= window:
+            windows.append((start, end))
+            continue
+        offsets = list(range(0, length - window + 1, hop))
+        if offsets[-1] + window < length:
+            # Last window ends exactly at the end of the region
+            offsets.append(length - window)
+        windows += [(start + offset, start + offset + window) for offset in offsets]
+    return np.array(windows, dtype=np.int64).reshape(-1, 2)
+
+
+def agglomerative_clustering(embeddings, threshold=CLUSTER_THRESHOLD, num_clusters=None):
+    """
+    Average-linkage clustering on cosine similarity; returns labels numbered by first appearance.
+
+    Merges the two most similar clusters until ``num_clusters`` remain or, without it,
+    until no pair averages ``threshold`` or more.
+    """
+    sim = l2_normalize(embeddings) @ l2_normalize(embeddings).T if len(embeddings) else np.empty((0, 0))
+    n = len(sim)
+    np.fill_diagonal(sim, -np.inf)
+    sizes = np.ones(n)
+    assign = np.arange(n)
+    nearest = sim.argmax(axis=1) if n else np.empty(0, dtype=np.int64)
+    nearest_sim = sim[np.arange(n), nearest]
+    clusters = n
+    while clusters > (num_clusters or 1):
+        i = int(nearest_sim.argmax())
+        if nearest_sim[i] == -np.inf or (num_clusters is None and nearest_sim[i] < threshold):
+            break
+        j = int(nearest[i])
+        # Lance-Williams update for average linkage
+        merged = (sizes[i] * sim[i] + sizes[j] * sim[j]) / (sizes[i] + sizes[j])
+        merged[i] = merged[j] = -np.inf
+        sizes[i] += sizes[j]
+        sim[i], sim[:, i] = merged, merged
+        sim[j], sim[:, j] = -np.inf, -np.inf
+        assign[assign == j] = i
+        clusters -= 1
+        # Rows whose nearest cluster was i or j are rescanned; the rest can only gain i
+        stale = np.flatnonzero((nearest == i) | (nearest == j))
+        stale = np.union1d(stale[stale != j], [i])
+        nearest[stale] = sim[stale].argmax(axis=1)
+        nearest_sim[stale] = sim[stale, nearest[stale]]
+        nearest_sim[j] = -np.inf
+        closer = merged > nearest_sim
+        nearest[closer] = i
+        nearest_sim[closer] = merged[closer]
+    _, first, inverse = np.unique(assign, return_index=True, return_inverse=True)
+    return np.argsort(np.argsort(first))[inverse]
+
+
+def attribute_clusters(embeddings, labels, registry, threshold=0.75):
+    """{cluster: (speaker_id or None, similarity)} by scoring each cluster centroid against the registry."""
+    attribution = {}
+    for cluster in np.unique(labels).tolist():
+        centroid = l2_normalize(np.mean(l2_normalize(embeddings[labels == cluster]), axis=0))
+        matches = registry.identify(centroid, k=1) if registry is not None and len(registry) else []
+        if matches and matches[0][1] >= threshold:
+            attribution[cluster] = matches[0]
+        else:
+            attribution[cluster] = (None, matches[0][1] if matches else None)
+    return attribution
+
+
+def window_spans(windows, labels, attribution, sample_rate=TARGET_SAMPLE_RATE, max_gap_seconds=MAX_GAP_SECONDS):
+    """Merge labelled windows into Spans; overlapping windows split their overlap at the midpoint."""
+    if not len(windows):
+        return []
+    starts, ends = windows[:, 0].astype(np.float64), windows[:, 1].astype(np.float64)
+    overlapping = starts[1:] < ends[:-1]
+    midpoints = (starts[1:] + ends[:-1]) / 2
+    starts[1:][overlapping] = midpoints[overlapping]
+    ends[:-1][overlapping] = midpoints[overlapping]
+    # A span breaks where the cluster changes or the pause is too long
+    breaks = (labels[1:] != labels[:-1]) | (starts[1:] - ends[:-1] > max_gap_seconds * sample_rate)
+    first = np.concatenate([[0], np.flatnonzero(breaks) + 1])
+    last = np.concatenate([first[1:] - 1, [len(windows) - 1]])
+    spans = []
+    for a, b in zip(first.tolist(), last.tolist()):
+        cluster = int(labels[a])
+        speaker, similarity = attribution[cluster]
+        spans.append(Span(float(starts[a]) / sample_rate, float(ends[b]) / sample_rate, cluster, speaker, similarity))
+    return spans
+
+
+def diarize(audio, registry=None, sample_rate=None, threshold=0.75, cluster_threshold=CLUSTER_THRESHOLD,
+            num_speakers=None, window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS, min_seconds=MIN_SECONDS,
+            batch_size=16, embed_fn=None):
+    """
+    Spans of a recording (anything load_audio_16k accepts) attributed to speakers in
+    ``registry``; returns (spans, speech_ratio).
+
+    ``speech_ratio`` is the share of the recording in speech regions long enough to
+    attribute. If the VAD finds none (a quiet or noisy recording) the whole recording
+    is windowed instead, as trim_silence keeps the whole clip, and the ratio is 0.0.
+    Those spans are clustered but never attributed (``speaker`` is None), so silence
+    is not counted as an enrolled speaker's talk time.
+
+    ``embed_fn`` maps a list of 16 kHz signals to an (N, D) array; by default the
+    windows go through ``app.get_embeddings`` in batches of ``batch_size``.
+    """
+    if embed_fn is None:
+        import app
+        embed_fn = lambda signals: app.get_embeddings(signals, batch_size=batch_size, vad=False)
+    signal = load_audio_16k(audio, sample_rate)
+    audio_seconds = len(signal) / TARGET_SAMPLE_RATE
+    with profiling.stage("diarize_segment", audio_seconds):
+        segments = [(start, end) for start, end in speech_segments(signal, TARGET_SAMPLE_RATE)
+                    if end - start >= min_seconds * TARGET_SAMPLE_RATE]
+        speech_ratio = sum(end - start for start, end in segments) / max(len(signal), 1)
+        if not segments:
+            segments, speech_ratio = [(0, len(signal))], 0.0
+        windows = speech_windows(signal, TARGET_SAMPLE_RATE, window_seconds, hop_seconds, min_seconds, segments)
+    if not len(windows):
+        return [], speech_ratio
+    with profiling.stage("diarize_embed", float((windows[:, 1] - windows[:, 0]).sum()) / TARGET_SAMPLE_RATE):
+        embeddings = np.asarray(embed_fn([signal[start:end] for start, end in windows]), dtype=np.float32)
+    with profiling.stage("diarize_cluster", audio_seconds):
+        labels = agglomerative_clustering(embeddings, cluster_threshold, num_speakers)
+        attribution = attribute_clusters(embeddings, labels, registry, threshold)
+        if not speech_ratio:
+            # Keep the similarities for inspection, but none of it is known to be speech
+            attribution = {cluster: (None, similarity) for cluster, (_, similarity) in attribution.items()}
+    return window_spans(windows, labels, attribution), speech_ratio
+
+
+def speaker_time(spans):
+    """Total seconds per speaker label, longest first."""
+    totals = {}
+    for span in spans:
+        totals[span.label] = totals.get(span.label, 0.0) + span.end - span.start
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording")
+    parser.add_argument("--authorized-folder", default=AUTHORIZED_USER_FOLDER)
+    parser.add_argument("--speakers-folder", default=None, help="One subfolder of clips per enrolled speaker")
+    parser.add_argument("--num-speakers", type=int, default=None, help="Known number of speakers in the recording")
+    parser.add_argument("--cluster-threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--threshold", type=float, default=0.75, help="Cosine a cluster needs to match a speaker")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("-o", "--output", default=None, help="Write the spans as JSON")
+    args = parser.parse_args()
+
+    import app
+
+    # Windows of one recording are never repeated, so the embedding cache would only cost memory
+    app.EMBEDDING_CACHE_SIZE = 0
+    if args.speakers_folder:
+        registry = app.register_speakers(args.speakers_folder)
+    else:
+        registry = SpeakerRegistry()
+        registry.add(args.authorized_folder, app.register_authorized_speaker(args.authorized_folder))
+    spans, speech_ratio = diarize(args.recording, registry, threshold=args.threshold,
+                                  cluster_threshold=args.cluster_threshold, num_speakers=args.num_speakers,
+                                  batch_size=args.batch_size)
+    if spans and not speech_ratio:
+        print("No speech found by the VAD; the whole recording was clustered without attributing it")
+
+    for span in spans:
+        similarity = f"{span.similarity:.3f}" if span.similarity is not None else "-"
+        print(f"{span.start:9.2f} - {span.end:9.2f}  {span.label:<24} {similarity}")
+    for label, seconds in speaker_time(spans).items():
+        print(f"{label}: {seconds:.1f}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([span._asdict() for span in spans], f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
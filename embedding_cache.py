@@ -0,0 +1,95 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with an in-memory LRU tier and an optional disk tier.
+
+    Keys are a BLAKE2b hash of the decoded PCM samples together with the model identity,
+    so the same audio hits the cache however it arrived (path, upload, re-recording of
+    the same bytes). Cached embeddings are read-only arrays.
+    """
+
+    def __init__(self, model_id="", max_entries=1024, disk_dir=None):
+        self.model_id = model_id.encode()
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, signal):
+        """Hash of the PCM samples and the model identity."""
+        digest = hashlib.blake2b(self.model_id, digest_size=16)
+        digest.update(np.ascontiguousarray(signal, dtype=np.float32).data)
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached embedding or None."""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+        if self.disk_dir is not None:
+            try:
+                embedding = np.load(self._disk_path(key))
+            except (OSError, ValueError):
+                embedding = None
+            if embedding is not None:
+                self._remember(key, embedding)
+                with self._lock:
+                    self.disk_hits += 1
+                return embedding
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, embedding):
+        """Cache an embedding in memory and, if configured, on disk."""
+        embedding = np.array(embedding, dtype=np.float32)
+        if self.disk_dir is not None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+            np.save(tmp_path, embedding)
+            os.replace(tmp_path, self._disk_path(key))
+        return self._remember(key, embedding)
+
+    def _remember(self, key, embedding):
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return embedding
+
+    def clear(self):
+        """Empty the memory tier (the disk tier is left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Constants
+MODEL_DIR = "pretrained_models/spkrec-ecapa-voxceleb"  # Checkpoint folder the embeddings depend on
+STORE_DIR = "embedding_store"  # Where cached enrollment embeddings are kept
+MANIFEST_NAME = "manifest.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file's content."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat(path):
+    # Checkpoints may be symlinks into the HF cache; fall back to the link itself if it is dangling
+    try:
+        return os.stat(path)
+    except OSError:
+        return os.lstat(path)
+
+
+def model_fingerprint(model_dir=MODEL_DIR, pipeline=""):
+    """
+    Identify the model checkpoint by the name, size and mtime of every file in its folder.
+
+    ``pipeline`` describes any pre-processing that changes the embeddings (e.g. the
+    front-end sample rate) so that changing it also invalidates the store.
+    """
+    digest = hashlib.sha1(pipeline.encode())
+    if os.path.isdir(model_dir):
+        for file_name in sorted(os.listdir(model_dir)):
+            st = _stat(os.path.join(model_dir, file_name))
+            digest.update(f"{file_name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent cache of per-file embeddings.
+
+    Each embedding lives in its own ``<sha1>.npy`` file and is memory-mapped on load.
+    ``manifest.json`` maps the absolute audio path to its size, mtime and content hash,
+    so unchanged files are served without touching the model. The whole store is
+    invalidated when the model checkpoint or the pre-processing pipeline changes.
+    """
+
+    def __init__(self, root=STORE_DIR, model_dir=MODEL_DIR, pipeline=""):
+        self.root = root
+        self.model = model_fingerprint(model_dir, pipeline)
+        self.entries = {}
+        self.dirty = False
+        self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("model") != self.model:
+            # Embeddings from another checkpoint are useless; drop them all
+            self.clear()
+            return
+        self.entries = manifest.get("entries", {})
+
+    def _npy_path(self, digest):
+        return os.path.join(self.root, f"{digest}.npy")
+
+    def lookup(self, path):
+        """Return the cached embedding for ``path``, or None if it is missing or stale."""
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        st = os.stat(path)
+        if st.st_size != entry["size"]:
+            return None
+        if st.st_mtime_ns != entry["mtime_ns"]:
+            # Touched but possibly unchanged: only re-embed if the content differs
+            if file_digest(path) != entry["sha1"]:
+                return None
+            entry["mtime_ns"] = st.st_mtime_ns
+            self.dirty = True
+        try:
+            return np.load(self._npy_path(entry["sha1"]), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def put(self, path, embedding):
+        """Store the embedding of ``path`` keyed by its current size, mtime and content hash."""
+        os.makedirs(self.root, exist_ok=True)
+        st = os.stat(path)
+        digest = file_digest(path)
+        # Replacing a changed file: release its old .npy first
+        self.remove(path)
+        np.save(self._npy_path(digest), np.asarray(embedding, dtype=np.float32))
+        self.entries[os.path.abspath(path)] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha1": digest,
+        }
+        self.dirty = True
+
+    def remove(self, path):
+        """Forget a single file; its .npy is deleted once no other entry shares it."""
+        entry = self.entries.pop(os.path.abspath(path), None)
+        if entry is None:
+            return
+        self.dirty = True
+        if all(e["sha1"] != entry["sha1"] for e in self.entries.values()):
+            try:
+                os.remove(self._npy_path(entry["sha1"]))
+            except OSError:
+                pass
+
+    def prune(self):
+        """Drop entries whose audio file no longer exists."""
+        for key in [k for k in self.entries if not os.path.exists(k)]:
+            self.remove(key)
+
+    def clear(self):
+        """Remove every cached embedding."""
+        if os.path.isdir(self.root):
+            for file_name in os.listdir(self.root):
+                if file_name.endswith(".npy"):
+                    os.remove(os.path.join(self.root, file_name))
+        self.entries = {}
+        self.dirty = True
+
+    def save(self):
+        """Atomically write the manifest if anything changed."""
+        if not self.dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": self.model, "entries": self.entries}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        self.dirty = False
+
+    def pack(self, path, kind="float16", **kwargs):
+        """
+        Write every cached embedding into one memory-mapped compact store at ``path``.
+
+        Returns the ``compact_store.CompactEmbeddings``; row ``i`` has id ``i`` and is the
+        audio file ``keys[i]`` of the ``keys.json`` written next to it.
+        """
+        from compact_store import CompactEmbeddings
+
+        keys = sorted(self.entries)
+        if not keys:
+            raise ValueError("Nothing to pack: the embedding store is empty")
+        embeddings = np.stack([np.load(self._npy_path(self.entries[key]["sha1"])) for key in keys])
+        store = CompactEmbeddings.create(path, kind, embeddings.shape[1],
+                                         train=embeddings if kind == "pq" else None, **kwargs)
+        store.append(np.arange(len(keys)), embeddings)
+        with open(os.path.join(path, "keys.json"), "w") as f:
+            json.dump(keys, f, indent=1)
+        return store
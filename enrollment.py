@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import namedtuple
+import app
+from speaker_registry import SpeakerRegistry
+
+
+class EnrollmentStatus(namedtuple("EnrollmentStatus", "state done total error started_at finished_at")):
+    """Snapshot of a job: state is idle, running, done or failed; done/total count clips."""
+
+    __slots__ = ()
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+
+class BackgroundEnroller:
+    """
+    Enroll speakers from folders on a worker thread while callers keep verifying.
+
+    ``registry`` is always a complete registry. ``start`` copies it and brings the
+    copy in line with the given folders on a background thread (only new or changed
+    files are embedded, see ``app.enroll_speaker``). When the job is done the copy
+    replaces the published registry in one reference swap, so readers see either the
+    old enrollment or the new one, never a half-built one.
+
+    Changes such as clips enrolled over HTTP go through ``mutate``, which publishes them
+    the same way (copy, change, swap) and, while a job runs, replays them onto the new
+    registry before its swap.
+    """
+
+    def __init__(self, registry=None, store=None, batch_size=16):
+        self._registry = registry if registry is not None else SpeakerRegistry()
+        self.store = store
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        self._finished = threading.Event()
+        self._finished.set()
+        self._status = EnrollmentStatus("idle", 0, 0, None, None, None)
+
+    @property
+    def registry(self):
+        """The current complete registry; do not modify it directly, use mutate."""
+        return self._registry
+
+    def centroid(self, speaker_id):
+        """A speaker's current centroid, or None while it has never been enrolled."""
+        registry = self._registry
+        return registry.get(speaker_id).copy() if speaker_id in registry else None
+
+    def status(self):
+        return self._status
+
+    def start(self, folders):
+        """
+        Start enrolling ``{speaker_id: folder}`` in the background; returns self.
+
+        Raises RuntimeError if a job is already running.
+        """
+        with self._lock:
+            if self._status.running:
+                raise RuntimeError("An enrollment job is already running")
+            registry = self._registry.copy()
+            self._journal = []
+            self._finished.clear()
+            self._status = EnrollmentStatus("running", 0, 0, None, time.time(), None)
+        self._thread = threading.Thread(target=self._run, args=(dict(folders), registry),
+                                        name="enrollment", daemon=True)
+        self._thread.start()
+        return self
+
+    def _set_progress(self, done, total):
+        self._status = self._status._replace(done=done, total=total)
+
+    def _run(self, folders, registry):
+        try:
+            total = sum(len(os.listdir(folder)) for folder in folders.values())
+            offset = 0
+            self._set_progress(0, total)
+            for speaker_id, folder in folders.items():
+                app.enroll_speaker(speaker_id, folder, registry, self.store, self.batch_size,
+                                   progress=lambda done, _, offset=offset: self._set_progress(offset + done, total))
+                offset += len(os.listdir(folder))
+            with self._lock:
+                for change in self._journal:
+                    change(registry)
+                self._journal = None
+                self._registry = registry
+                self._status = self._status._replace(state="done", finished_at=time.time())
+        except Exception as e:
+            with self._lock:
+                self._journal = None
+                self._status = self._status._replace(state="failed", error=f"{type(e).__name__}: {e}",
+                                                     finished_at=time.time())
+        finally:
+            self._finished.set()
+
+    def mutate(self, change):
+        """
+        Apply ``change(registry)`` now, and again to the registry a running job will swap in.
+
+        The change is made on a copy that is then swapped in, so readers on any thread
+        keep seeing a complete registry. The copy shares per-speaker sample statistics
+        but still copies the centroid matrix, so call it off any event loop; it suits
+        enrollment-rate changes, not bulk loading (use ``start`` for that).
+        """
+        with self._lock:
+            registry = self._registry.copy()
+            change(registry)
+            self._registry = registry
+            if self._journal is not None:
+                self._journal.append(change)
+
+    def wait(self, timeout=None):
+        """Block until the current job has finished; returns False on timeout."""
+        return self._finished.wait(timeout)
+
+
+def streamlit_status(enroller, folder, refresh_seconds=0.5):
+    """
+    Show an enroller's state for ``folder`` on a Streamlit page; returns (centroid or None, status).
+
+    While a job runs its progress bar refreshes every ``refresh_seconds`` and the whole
+    page reruns once it finishes, so the new enrollment is picked up without a click.
+    Otherwise a button re-enrolls the folder to pick up clips added since.
+    """
+    import streamlit as st
+
+    status = enroller.status()
+    if status.running:
+        @st.fragment(run_every=refresh_seconds)
+        def progress():
+            current = enroller.status()
+            if not current.running:
+                st.rerun()
+            st.progress(current.done / max(current.total, 1), text="Registering authorized speaker in the "
+                        f"background... {current.done}/{current.total} clips")
+
+        progress()
+    elif status.error:
+        st.error(f"Registering the authorized speaker failed: {status.error}")
+    else:
+        st.success("Authorized speaker registered!")
+    if not status.running and st.button("Re-register authorized speaker"):
+        try:
+            enroller.start({folder: folder})
+        except RuntimeError:
+            # Another session started a job since this page was drawn; the rerun shows its progress
+            pass
+        st.rerun()
+    return enroller.centroid(folder), status
@@ -0,0 +1,369 @@
+"""
+Offline accuracy and speed evaluation of the verification pipeline.
+
+Genuine and impostor trials are built from local audio only. Every pair of enrollment
+clips is a genuine trial, and so is every pair of a clip with noisy or reverberant copies
+of the other clips. Impostors are pitch/formant-shifted copies of the enrollment clips and
+synthetic voices, or a folder of real impostor recordings when one is available. All
+trials are scored in one vectorized pass, and the report has EER, minDCF, the error
+rates at the deployed threshold and DET points, next to the time spent in the decode,
+embed and score stages.
+
+Usage:
+    python evaluate.py [--folder authenticated_user] [--impostors FOLDER] [--backend eager]
+                       [--threshold 0.75] [-o report.json] [--baseline old_report.json]
+                       [--trials trials.csv] [--plot det.png] [--cohort cohort/embeddings.npy]
+
+Run it before and after a performance change with the same arguments; --baseline prints
+how EER, minDCF and throughput moved against an earlier report. With --cohort the
+metrics are computed on AS-norm scores (see score_norm.py) and the raw-cosine EER is
+reported alongside, which is how a threshold for normalized scores is chosen.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from statistics import NormalDist
+import numpy as np
+from audio_io import TARGET_SAMPLE_RATE, resample
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
+NOISE_SNRS_DB = (20, 10)  # Genuine copies with white noise at these SNRs
+REVERB_RT60S = (0.4,)  # Genuine copies with synthetic room reverb of these decay times
+PITCH_FACTORS = (0.75, 0.85, 1.2, 1.35)  # Impostor copies resampled by these factors
+SYNTHETIC_VOICES = 8  # Generated impostor voices
+P_TARGET = 0.01  # Prior of a target trial for minDCF (NIST SRE convention)
+DET_POINTS = 200  # DET points kept in the report
+
+
+def add_noise(signal, snr_db, rng):
+    """White noise at the given signal-to-noise ratio."""
+    noise = rng.standard_normal(len(signal)).astype(np.float32)
+    scale = np.sqrt(np.mean(signal ** 2) / (np.mean(noise ** 2) * 10 ** (snr_db / 10)))
+    return signal + scale * noise
+
+
+def add_reverb(signal, rt60, rng, sample_rate=TARGET_SAMPLE_RATE):
+    """Convolve with an exponentially decaying noise impulse response (60 dB down after rt60 s)."""
+    t = np.arange(int(rt60 * sample_rate)) / sample_rate
+    impulse = rng.standard_normal(len(t)) * 10 ** (-3 * t / rt60)
+    impulse[0] = 1.0
+    wet = np.convolve(signal, impulse / np.linalg.norm(impulse))[:len(signal)]
+    return (wet * np.abs(signal).max() / max(np.abs(wet).max(), 1e-9)).astype(np.float32)
+
+
+def pitch_shift(signal, factor):
+    """Lower (factor > 1) or raise the pitch and formants by resampling, as if spoken by someone else."""
+    return resample(signal, TARGET_SAMPLE_RATE, int(TARGET_SAMPLE_RATE * factor))
+
+
+def synthetic_impostors(signals, factors=(0.8, 1.25)):
+    """Pitch- and formant-shifted copies of clips, standing in for other speakers."""
+    return [pitch_shift(s, f) for s in signals for f in factors]
+
+
+def synthetic_voice(rng, seconds=3.0, sample_rate=TARGET_SAMPLE_RATE):
+    """A crude voiced signal: a jittered harmonic source shaped by random formants, in syllables."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = rng.uniform(90, 250) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    harmonics = np.arange(1, int(sample_rate / 2 / f0.max()) + 1)
+    formants = rng.uniform([300, 900, 2200], [900, 2200, 3500])
+    # Formant envelope evaluated at the mean frequency of each harmonic
+    freqs = harmonics * f0.mean()
+    envelope = sum(np.exp(-0.5 * ((freqs - f) / 120.0) ** 2) for f in formants) + 0.01
+    voiced = (envelope[:, None] * np.sin(harmonics[:, None] * phase)).sum(axis=0)
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None)
+    signal = voiced * syllables + 0.01 * rng.standard_normal(len(t))
+    return (0.3 * signal / np.abs(signal).max()).astype(np.float32)
+
+
+def build_clips(folder, impostor_folder=None, seed=0):
+    """
+    Decode the evaluation clips and derive the synthetic ones.
+
+    Returns (clips, decode_seconds, augment_seconds) where each clip is a dict with
+    ``name``, ``source`` (the recording it came from), ``speaker`` and ``signal``.
+    """
+    import app
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    genuine = [(name, app.load_signal(os.path.join(folder, name))) for name in sorted(os.listdir(folder))]
+    impostors = []
+    if impostor_folder:
+        impostors = [(name, app.load_signal(os.path.join(impostor_folder, name)))
+                     for name in sorted(os.listdir(impostor_folder))]
+    decode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    clips = [{"name": name, "source": name, "speaker": "target", "signal": s} for name, s in genuine]
+    for name, signal in genuine:
+        clips += [{"name": f"{name}+noise{snr}dB", "source": name, "speaker": "target",
+                   "signal": add_noise(signal, snr, rng)} for snr in NOISE_SNRS_DB]
+        clips += [{"name": f"{name}+reverb{rt60}s", "source": name, "speaker": "target",
+                   "signal": add_reverb(signal, rt60, rng)} for rt60 in REVERB_RT60S]
+    clips += [{"name": name, "source": name, "speaker": f"impostor:{name}", "signal": s} for name, s in impostors]
+    if not impostors:
+        # Each shift factor sounds like one different (if unnatural) speaker
+        clips += [{"name": f"{name}*pitch{factor}", "source": name, "speaker": f"pitch{factor}",
+                   "signal": pitch_shift(signal, factor)} for name, signal in genuine for factor in PITCH_FACTORS]
+        clips += [{"name": f"synthetic{i}", "source": f"synthetic{i}", "speaker": f"synthetic{i}",
+                   "signal": synthetic_voice(rng)} for i in range(SYNTHETIC_VOICES)]
+    return clips, decode_seconds, time.perf_counter() - start
+
+
+def build_trials(clips):
+    """
+    Enrollment/test index pairs with their labels (1 genuine, 0 impostor).
+
+    Every original target recording is an enrollment clip. It is tried against every
+    other clip except copies of itself, so an augmented copy never scores against its
+    own source.
+    """
+    speakers = np.array([c["speaker"] for c in clips])
+    sources = np.array([c["source"] for c in clips])
+    originals = np.flatnonzero([c["speaker"] == "target" and c["name"] == c["source"] for c in clips])
+    enroll, test = np.meshgrid(originals, np.arange(len(clips)), indexing="ij")
+    enroll, test = enroll.ravel(), test.ravel()
+    keep = sources[enroll] != sources[test]
+    # An unordered pair of two original recordings is one trial, not two
+    both_original = np.isin(test, originals)
+    keep &= ~both_original | (enroll < test)
+    enroll, test = enroll[keep], test[keep]
+    return enroll, test, (speakers[test] == "target").astype(np.int8)
+
+
+def score_trials(embeddings, enroll, test):
+    """Cosine score of every trial, vectorized."""
+    from speaker_registry import l2_normalize
+
+    embeddings = l2_normalize(embeddings)
+    return np.einsum("ij,ij->i", embeddings[enroll], embeddings[test])
+
+
+def error_rates(scores, labels):
+    """
+    False-acceptance and false-rejection rates at every distinct threshold.
+
+    A trial is accepted when its score is >= the threshold. Returns (thresholds, far,
+    frr) sorted by increasing threshold, ending with one above every score.
+    """
+    genuine = np.sort(scores[labels == 1])
+    impostor = np.sort(scores[labels == 0])
+    thresholds = np.concatenate([np.unique(scores), [np.inf]])
+    frr = np.searchsorted(genuine, thresholds, side="left") / max(len(genuine), 1)
+    far = 1 - np.searchsorted(impostor, thresholds, side="left") / max(len(impostor), 1)
+    return thresholds, far, frr
+
+
+def compute_eer(far, frr, thresholds):
+    """Equal error rate and its threshold."""
+    i = np.argmin(np.abs(far - frr))
+    return float((far[i] + frr[i]) / 2), float(thresholds[i])
+
+
+def compute_min_dcf(far, frr, thresholds, p_target=P_TARGET, c_miss=1.0, c_fa=1.0):
+    """Minimum normalized detection cost and its threshold."""
+    dcf = c_miss * p_target * frr + c_fa * (1 - p_target) * far
+    i = np.argmin(dcf)
+    return float(dcf[i] / min(c_miss * p_target, c_fa * (1 - p_target))), float(thresholds[i])
+
+
+def det_points(far, frr, max_points=DET_POINTS):
+    """Evenly thinned (far, frr) pairs for a DET curve."""
+    keep = np.unique(np.linspace(0, len(far) - 1, min(max_points, len(far))).astype(int))
+    return far[keep].tolist(), frr[keep].tolist()
+
+
+def plot_det(far, frr, path, eer):
+    """Save a DET curve with both axes on the normal-deviate scale."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    ppf = np.vectorize(NormalDist().inv_cdf)
+    ticks = np.array([0.001, 0.01, 0.05, 0.2, 0.5])
+    fig, ax = plt.subplots(figsize=(5, 5))
+    ax.plot(ppf(np.clip(far, 1e-4, 1 - 1e-4)), ppf(np.clip(frr, 1e-4, 1 - 1e-4)))
+    ax.set_xticks(ppf(ticks), [f"{t:g}" for t in ticks * 100])
+    ax.set_yticks(ppf(ticks), [f"{t:g}" for t in ticks * 100])
+    ax.set_xlabel("False acceptance rate (%)")
+    ax.set_ylabel("False rejection rate (%)")
+    ax.set_title(f"DET (EER {eer * 100:.2f}%)")
+    ax.grid(True)
+    fig.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+
+
+def _stage(seconds, clips, audio_seconds):
+    return {"seconds": seconds, "clips_per_s": clips / max(seconds, 1e-9),
+            "realtime_factor": audio_seconds / max(seconds, 1e-9)}
+
+
+def evaluate(folder=AUTHORIZED_USER_FOLDER, impostor_folder=None, threshold=0.75, batch_size=16, seed=0,
+             normalizer=None):
+    """
+    Run the whole evaluation; returns the report dict and the per-trial arrays.
+
+    With a ScoreNormalizer the metrics are computed on normalized scores.
+    """
+    import app
+
+    # Every clip should reach the model, not the embedding cache
+    app.EMBEDDING_CACHE_SIZE = 0
+    app._embedding_cache = None
+    app.warmup()
+
+    clips, decode_seconds, augment_seconds = build_clips(folder, impostor_folder, seed)
+    signals = [c["signal"] for c in clips]
+    originals = [c["signal"] for c in clips if c["name"] == c["source"]]
+    audio_seconds = sum(len(s) for s in signals) / TARGET_SAMPLE_RATE
+    original_seconds = sum(len(s) for s in originals) / TARGET_SAMPLE_RATE
+
+    start = time.perf_counter()
+    embeddings = app.get_embeddings(signals, batch_size=batch_size, vad=False)
+    embed_seconds = time.perf_counter() - start
+    single = []
+    for signal in originals:
+        start = time.perf_counter()
+        app.get_embedding(signal, vad=False)
+        single.append(time.perf_counter() - start)
+
+    enroll, test, labels = build_trials(clips)
+    start = time.perf_counter()
+    scores = score_trials(embeddings, enroll, test)
+    score_seconds = time.perf_counter() - start
+
+    score_norm = None
+    if normalizer is not None:
+        thresholds, far, frr = error_rates(scores, labels)
+        raw_eer, _ = compute_eer(far, frr, thresholds)
+        raw_min_dcf, _ = compute_min_dcf(far, frr, thresholds)
+        start = time.perf_counter()
+        mean, std = normalizer.cohort_stats(embeddings)
+        scores = normalizer.normalize(scores, (mean[enroll], std[enroll]), (mean[test], std[test]))
+        score_norm = {"cohort_size": len(normalizer.cohort), "top_k": normalizer.top_k, "raw_eer": raw_eer,
+                      "raw_min_dcf": raw_min_dcf, "seconds": time.perf_counter() - start}
+
+    thresholds, far, frr = error_rates(scores, labels)
+    eer, eer_threshold = compute_eer(far, frr, thresholds)
+    min_dcf, min_dcf_threshold = compute_min_dcf(far, frr, thresholds)
+    accepted = scores >= threshold
+    det_far, det_frr = det_points(far, frr)
+    report = {
+        "backend": app.EMBEDDING_BACKEND,
+        "pipeline": app.pipeline_id(),
+        "clips": {"total": len(clips), "original": len(originals), "audio_seconds": audio_seconds},
+        "trials": {"genuine": int(labels.sum()), "impostor": int(len(labels) - labels.sum())},
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+        "min_dcf": min_dcf,
+        "min_dcf_threshold": min_dcf_threshold,
+        "p_target": P_TARGET,
+        "at_threshold": {
+            "threshold": threshold,
+            "far": float(accepted[labels == 0].mean()),
+            "frr": float(1 - accepted[labels == 1].mean()),
+        },
+        "det": {"far": det_far, "frr": det_frr},
+        "score_norm": score_norm,
+        "timing": {
+            "decode": _stage(decode_seconds, len(originals), original_seconds),
+            "augment": _stage(augment_seconds, len(clips) - len(originals), audio_seconds - original_seconds),
+            "embed": _stage(embed_seconds, len(clips), audio_seconds),
+            "embed_single_ms": {"p50": float(np.percentile(single, 50) * 1000),
+                                "p99": float(np.percentile(single, 99) * 1000)},
+            "score": {"seconds": score_seconds, "trials_per_s": len(scores) / max(score_seconds, 1e-9)},
+        },
+    }
+    return report, (clips, enroll, test, labels, scores)
+
+
+def print_report(report, baseline=None):
+    """Human-readable summary, with changes against a baseline report if given."""
+    def delta(value, key, fmt, path=()):
+        if baseline is None:
+            return ""
+        old = baseline
+        for p in path + (key,):
+            old = old[p]
+        return f"  ({value - old:+{fmt}} vs baseline)"
+
+    timing = report["timing"]
+    at = report["at_threshold"]
+    print(f"backend:    {report['backend']}  ({report['pipeline']})")
+    print(f"trials:     {report['trials']['genuine']} genuine, {report['trials']['impostor']} impostor "
+          f"from {report['clips']['total']} clips")
+    print(f"EER:        {report['eer'] * 100:6.2f}% at threshold {report['eer_threshold']:.3f}"
+          f"{delta(report['eer'], 'eer', '.4f')}")
+    print(f"minDCF:     {report['min_dcf']:6.3f} at threshold {report['min_dcf_threshold']:.3f} "
+          f"(p_target {report['p_target']}){delta(report['min_dcf'], 'min_dcf', '.4f')}")
+    if report.get("score_norm"):
+        norm = report["score_norm"]
+        print(f"AS-norm:    cohort {norm['cohort_size']}, top-k {norm['top_k']}; raw cosine EER "
+              f"{norm['raw_eer'] * 100:.2f}%, minDCF {norm['raw_min_dcf']:.3f}")
+    print(f"@{at['threshold']}:      FAR {at['far'] * 100:6.2f}%  FRR {at['frr'] * 100:6.2f}%")
+    for stage in ("decode", "augment", "embed"):
+        t = timing[stage]
+        print(f"{stage + ':':<11} {t['clips_per_s']:8.2f} clips/s  {t['realtime_factor']:8.1f}x real time"
+              f"{delta(t['clips_per_s'], 'clips_per_s', '.2f', ('timing', stage))}")
+    print(f"single:     p50 {timing['embed_single_ms']['p50']:7.1f} ms  p99 {timing['embed_single_ms']['p99']:7.1f} ms")
+    print(f"score:      {timing['score']['trials_per_s']:,.0f} trials/s")
+
+
+def write_trials(path, clips, enroll, test, labels, scores):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["enroll", "test", "label", "score"])
+        for e, t, label, score in zip(enroll, test, labels, scores):
+            writer.writerow([clips[e]["name"], clips[t]["name"], int(label), f"{score:.6f}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default=AUTHORIZED_USER_FOLDER, help="Target speaker clips")
+    parser.add_argument("--impostors", default=None,
+                        help="Folder of real impostor clips (default: pitch-shifted and synthetic voices)")
+    parser.add_argument("--backend", default=None, help="Embedding backend (default: app.EMBEDDING_BACKEND)")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Deployed decision threshold")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="Write the report as JSON")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare against")
+    parser.add_argument("--trials", default=None, help="Write every trial and its score as CSV")
+    parser.add_argument("--plot", default=None, help="Save the DET curve as an image")
+    parser.add_argument("--cohort", default=None, help="Evaluate AS-norm scores against this cohort .npy")
+    parser.add_argument("--top-k", type=int, default=None, help="Cohort scores per side (default score_norm.TOP_K)")
+    args = parser.parse_args()
+
+    if args.backend:
+        import app
+        app.EMBEDDING_BACKEND = args.backend
+
+    normalizer = None
+    if args.cohort:
+        from score_norm import TOP_K, ScoreNormalizer
+        normalizer = ScoreNormalizer.load(args.cohort, args.top_k or TOP_K)
+
+    report, (clips, enroll, test, labels, scores) = evaluate(args.folder, args.impostors, args.threshold,
+                                                             args.batch_size, args.seed, normalizer)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.trials:
+        write_trials(args.trials, clips, enroll, test, labels, scores)
+    if args.plot:
+        plot_det(np.array(report["det"]["far"]), np.array(report["det"]["frr"]), args.plot, report["eer"])
+
+
+if __name__ == "__main__":
+    main()
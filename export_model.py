@@ -0,0 +1,129 @@
+"""
+Export the ECAPA embedding model for the optimized inference backends.
+
+Usage:
+    python export_model.py [--format torchscript|onnx|onnx-int8|all] [--quantize dynamic|static]
+                           [--check] [--tolerance 1e-3] [--batch-size 4]
+
+With --check the exported graphs are compared against the eager SpeechBrain model on
+the authenticated_user clips, one clip at a time and in padded mixed-length batches
+(the path get_embeddings and enrollment use); the command exits non-zero if any
+embedding differs by more than the tolerance. Select a backend at runtime with SPKREC_BACKEND=torchscript
+(or onnx, onnx-int8), or by setting app.EMBEDDING_BACKEND before the first embedding.
+
+onnx-int8 is quantized, so it is not expected to match the eager model to 1e-3; --check
+instead requires every embedding to keep a cosine of at least --min-int8-cosine with the
+eager one. `python benchmark.py quantization` reports its score drift and speedup.
+Static quantization calibrates on the authenticated_user clips.
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from inference_backend import (EXPORT_DIR, EagerBackend, export_onnx, export_onnx_int8, export_torchscript,
+                               load_backend)
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Clips used for the parity check
+QUANTIZED_FORMATS = ("onnx-int8",)  # Checked by cosine to the eager embedding, not max |diff|
+
+
+def embed_all(backend, signals):
+    """Embed each 16 kHz signal on its own with the given backend; returns (N, D)."""
+    import torch
+
+    return np.stack([backend.encode(torch.from_numpy(s).unsqueeze(0)).squeeze().numpy() for s in signals])
+
+
+def embed_batched(backend, signals, batch_size=4):
+    """
+    Embed signals in zero-padded batches with fractional wav_lens, as app.get_embeddings does.
+
+    Clips are batched in the given (unsorted) order, so every batch mixes lengths and
+    exercises the padding masks.
+    """
+    import torch
+
+    embeddings = []
+    for start in range(0, len(signals), batch_size):
+        batch = signals[start:start + batch_size]
+        lengths = np.array([len(s) for s in batch])
+        padded = np.zeros((len(batch), lengths.max()), dtype=np.float32)
+        for row, signal in enumerate(batch):
+            padded[row, :len(signal)] = signal
+        wav_lens = torch.tensor(lengths / lengths.max(), dtype=torch.float32)
+        embeddings.append(backend.encode(torch.from_numpy(padded), wav_lens).squeeze(1).numpy())
+    return np.concatenate(embeddings)
+
+
+def load_signals(folder=AUTHORIZED_USER_FOLDER):
+    """Every clip in a folder as the 16 kHz speech the model sees."""
+    import app
+
+    return [app.load_signal(os.path.join(folder, name)) for name in sorted(os.listdir(folder))]
+
+
+def check_parity(model, formats, folder=AUTHORIZED_USER_FOLDER, tolerance=1e-3, min_int8_cosine=0.99,
+                 export_dir=EXPORT_DIR, batch_size=4):
+    """
+    Compare exported backends with the eager model; returns True if all are within tolerance.
+
+    Each backend is checked one clip at a time and in padded batches of ``batch_size``
+    mixed-length clips, against the eager model run the same way.
+    """
+    signals = load_signals(folder)
+    eager = EagerBackend(model)
+    modes = {
+        "single": embed_all,
+        f"batch={batch_size}": lambda backend, signals: embed_batched(backend, signals, batch_size),
+    }
+    references = {mode: embed(eager, signals) for mode, embed in modes.items()}
+    ok = True
+    for name in formats:
+        backend = load_backend(name, model, export_dir)
+        for mode, embed in modes.items():
+            embeddings, reference = embed(backend, signals), references[mode]
+            max_diff = np.abs(embeddings - reference).max()
+            cosine = np.sum(embeddings * reference, axis=1) / (
+                np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1))
+            passed = cosine.min() >= min_int8_cosine if name in QUANTIZED_FORMATS else max_diff <= tolerance
+            ok &= passed
+            print(f"{name:>12} {mode:>8}: max |diff| {max_diff:.2e}  min cosine {cosine.min():.6f}  "
+                  f"{'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=["torchscript", "onnx", "onnx-int8", "all"], default="all")
+    parser.add_argument("--quantize", choices=["dynamic", "static"], default="dynamic",
+                        help="int8 quantization mode for onnx-int8")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--check", action="store_true", help="Verify embeddings match the eager model")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--min-int8-cosine", type=float, default=0.99)
+    parser.add_argument("--batch-size", type=int, default=4, help="Batch size of the padded parity check")
+    args = parser.parse_args()
+
+    import app
+
+    model = app.get_model()
+    formats = ["torchscript", "onnx", "onnx-int8"] if args.format == "all" else [args.format]
+    exporters = {
+        "torchscript": export_torchscript,
+        "onnx": export_onnx,
+        "onnx-int8": lambda model, export_dir: export_onnx_int8(
+            model, export_dir, args.quantize,
+            calibration_signals=load_signals() if args.quantize == "static" else None),
+    }
+    for name in formats:
+        print(f"exported {name}: {exporters[name](model, args.export_dir)}")
+
+    if args.check and not check_parity(model, formats, tolerance=args.tolerance,
+                                       min_int8_cosine=args.min_int8_cosine, export_dir=args.export_dir,
+                                       batch_size=args.batch_size):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
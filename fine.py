@@ -1,21 +1,16 @@
 import streamlit as st
 import numpy as np
-import librosa
-import soundfile as sf
 import os
 from io import BytesIO
-from app import register_authorized_speaker, is_authorized_speaker
+from app import is_authorized_speaker
+from enrollment import BackgroundEnroller, streamlit_status
+from audio_io import to_wav_bytes
 
 # Constants
 AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
-TEMP_AUDIO_FOLDER = "temp_audio"  # Path to save uploaded and recorded audio files temporarily
 SAMPLE_RATE = 22050  # Sample rate for recording
 DURATION = 5  # Duration of the recording in seconds
 
-# Create temp_audio directory if it doesn't exist
-if not os.path.exists(TEMP_AUDIO_FOLDER):
-    os.makedirs(TEMP_AUDIO_FOLDER)
-
 # Initialize session state
 if 'authorized_embedding_avg' not in st.session_state:
     st.session_state.authorized_embedding_avg = None
@@ -24,20 +19,18 @@ if 'recording' not in st.session_state:
 if 'audio_data' not in st.session_state:
     st.session_state.audio_data = None
 
-# Register the authorized speaker (this can be done once, or dynamically)
-if os.path.exists(AUTHORIZED_USER_FOLDER) and st.session_state.authorized_embedding_avg is None:
-    st.session_state.authorized_embedding_avg = register_authorized_speaker(AUTHORIZED_USER_FOLDER)
-    st.success("Authorized speaker registered!")
+# Register the authorized speaker on a background thread shared by every session, so the
+# page renders straight away; verification uses the latest finished enrollment
+@st.cache_resource
+def get_enroller():
+    return BackgroundEnroller().start({AUTHORIZED_USER_FOLDER: AUTHORIZED_USER_FOLDER})
 
-def save_audio_file(audio_data, file_name):
-    file_path = os.path.join(TEMP_AUDIO_FOLDER, file_name)
-    sf.write(file_path, audio_data, SAMPLE_RATE)
-    return file_path
+st.session_state.authorized_embedding_avg = None
+if os.path.exists(AUTHORIZED_USER_FOLDER):
+    st.session_state.authorized_embedding_avg, status = streamlit_status(get_enroller(), AUTHORIZED_USER_FOLDER)
 
-def play_audio(file_path):
-    """Play audio file in Streamlit."""
-    audio_file = open(file_path, 'rb')
-    audio_bytes = audio_file.read()
+def play_audio(audio_bytes):
+    """Play audio bytes in Streamlit."""
     st.audio(audio_bytes, format='audio/wav')
 
 def generate_simulated_speech(duration=DURATION, sample_rate=SAMPLE_RATE):
@@ -82,14 +75,11 @@ if option == "Upload an audio file":
     uploaded_file = st.file_uploader("Upload an audio file to test", type=["wav", "mp3"])
 
     if uploaded_file is not None:
-        # Load the audio file using librosa
-        audio_data, _ = librosa.load(uploaded_file, sr=SAMPLE_RATE)
-        
-        # Save the uploaded file to a temporary path
-        new_audio_path = save_audio_file(audio_data, uploaded_file.name)
+        # Decode the upload straight from memory
+        audio_bytes = uploaded_file.getvalue()
         
         if st.session_state.authorized_embedding_avg is not None:
-            is_authorized, similarity = is_authorized_speaker(new_audio_path, st.session_state.authorized_embedding_avg)
+            is_authorized, similarity = is_authorized_speaker(audio_bytes, st.session_state.authorized_embedding_avg)
             
             if is_authorized:
                 st.success(f"Authorized speaker detected! Similarity score: {similarity:.2f}")
@@ -97,10 +87,7 @@ if option == "Upload an audio file":
                 st.error(f"Unknown speaker detected. Similarity score: {similarity:.2f}")
         
         # Playback
-        play_audio(new_audio_path)
-        
-        # Clean up the temporary file
-        os.remove(new_audio_path)
+        play_audio(audio_bytes)
 
 elif option == "Record your voice":
     st.write(f"Click 'Start Recording' to begin a {DURATION}-second simulated recording.")
@@ -122,23 +109,17 @@ elif option == "Record your voice":
     if not st.session_state.recording and st.session_state.audio_data is not None:
         st.write("Simulated recording finished. Testing the audio...")
         
-        # Save the simulated audio
-        temp_audio_path = save_audio_file(st.session_state.audio_data, "simulated_audio.wav")
-        
         # Play back the simulated audio
-        st.audio(temp_audio_path, format='audio/wav')
+        play_audio(to_wav_bytes(st.session_state.audio_data, SAMPLE_RATE))
         
         # Perform speaker recognition
         if st.session_state.authorized_embedding_avg is not None:
-            is_authorized, similarity = is_authorized_speaker(temp_audio_path, st.session_state.authorized_embedding_avg)
+            is_authorized, similarity = is_authorized_speaker(st.session_state.audio_data, st.session_state.authorized_embedding_avg, sample_rate=SAMPLE_RATE)
             
             if is_authorized:
                 st.success(f"Authorized speaker detected! Similarity score: {similarity:.2f}")
             else:
                 st.error(f"Unknown speaker detected. Similarity score: {similarity:.2f}")
         
-        # Clean up the temporary file
-        os.remove(temp_audio_path)
-        
         # Reset the audio data
-        st.session_state.audio_data = None
\ No newline at end of file
+        st.session_state.audio_data = None
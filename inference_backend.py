@@ -0,0 +1,193 @@
+"""
+Pluggable inference backends for the ECAPA embedding model.
+
+Every backend computes the same thing as ``SpeakerRecognition.encode_batch``: filterbank
+features and mean/variance normalisation run eagerly in SpeechBrain (they are cheap),
+then the ECAPA-TDNN ``embedding_model`` runs either eagerly, as a TorchScript module or
+as an ONNX Runtime session. Use ``export_model.py`` to produce the exported graphs.
+
+``onnx-int8`` is the opt-in quantized mode: the ONNX graph with int8 weights for the
+convolution and linear layers (dynamic quantization, or static with calibration on the
+enrollment clips). It trades a small score drift for speed on CPU-only nodes; measure
+both with ``python benchmark.py quantization`` before enabling it.
+"""
+import os
+
+# Constants
+EXPORT_DIR = "pretrained_models/spkrec-ecapa-voxceleb-export"  # Where exported graphs live
+TORCHSCRIPT_FILE = "embedding_model.ts"
+ONNX_FILE = "embedding_model.onnx"
+ONNX_INT8_FILE = "embedding_model.int8.onnx"
+BACKENDS = ("eager", "torchscript", "onnx", "onnx-int8")
+
+
+class EagerBackend:
+    """Plain SpeechBrain forward pass."""
+
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def features(self, wavs, wav_lens):
+        feats = self.model.mods.compute_features(wavs)
+        return self.model.mods.mean_var_norm(feats, wav_lens)
+
+    def run(self, feats, wav_lens):
+        return self.model.mods.embedding_model(feats, wav_lens)
+
+    def encode(self, wavs, wav_lens=None):
+        """(batch, samples) float32 waveforms -> (batch, 1, dim) embeddings tensor."""
+        import torch
+
+        if wav_lens is None:
+            wav_lens = torch.ones(wavs.shape[0])
+        with torch.no_grad():
+            return self.run(self.features(wavs.float(), wav_lens), wav_lens)
+
+
+class TorchScriptBackend(EagerBackend):
+    """ECAPA embedding model as a traced, frozen TorchScript module."""
+
+    name = "torchscript"
+
+    def __init__(self, model, export_dir=EXPORT_DIR):
+        import torch
+
+        super().__init__(model)
+        self.module = torch.jit.load(os.path.join(export_dir, TORCHSCRIPT_FILE), map_location="cpu")
+        self.module.eval()
+
+    def run(self, feats, wav_lens):
+        return self.module(feats, wav_lens)
+
+
+class ONNXBackend(EagerBackend):
+    """ECAPA embedding model on ONNX Runtime's CPU execution provider."""
+
+    name = "onnx"
+
+    def __init__(self, model, export_dir=EXPORT_DIR, threads=None, filename=ONNX_FILE):
+        import onnxruntime as ort
+
+        super().__init__(model)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(export_dir, filename), options,
+                                            providers=["CPUExecutionProvider"])
+
+    def run(self, feats, wav_lens):
+        import torch
+
+        outputs = self.session.run(None, {"feats": feats.numpy(), "wav_lens": wav_lens.float().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+class QuantizedONNXBackend(ONNXBackend):
+    """ECAPA embedding model with int8 weights on ONNX Runtime's CPU execution provider."""
+
+    name = "onnx-int8"
+
+    def __init__(self, model, export_dir=EXPORT_DIR, threads=None):
+        super().__init__(model, export_dir, threads, filename=ONNX_INT8_FILE)
+
+
+def load_backend(name, model, export_dir=EXPORT_DIR):
+    """Build the named backend around a loaded SpeakerRecognition model."""
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "torchscript":
+        return TorchScriptBackend(model, export_dir)
+    if name == "onnx":
+        return ONNXBackend(model, export_dir)
+    if name == "onnx-int8":
+        return QuantizedONNXBackend(model, export_dir)
+    raise ValueError(f"Unknown embedding backend {name!r}, expected one of {BACKENDS}")
+
+
+def _example_inputs(model, seconds=3.0, batch=2):
+    import torch
+
+    wavs = torch.randn(batch, int(seconds * 16000)) * 0.1
+    # Padded rows, so masks that depend on the true lengths are part of the graph
+    wav_lens = torch.linspace(1.0, 0.6, batch)
+    return EagerBackend(model).features(wavs, wav_lens), wav_lens
+
+
+def export_torchscript(model, export_dir=EXPORT_DIR):
+    """Trace and freeze the embedding model; returns the written path."""
+    import torch
+
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, TORCHSCRIPT_FILE)
+    embedding_model = model.mods.embedding_model.eval()
+    with torch.no_grad():
+        # Re-run on another batch size and length, so shapes baked in by tracing fail the export
+        traced = torch.jit.trace(embedding_model, _example_inputs(model), check_trace=True,
+                                 check_inputs=[_example_inputs(model, seconds=2.0, batch=3)])
+    torch.jit.save(torch.jit.freeze(traced), path)
+    return path
+
+
+def export_onnx(model, export_dir=EXPORT_DIR, opset=17):
+    """Export the embedding model to ONNX with dynamic batch and time axes; returns the written path."""
+    import torch
+
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model.mods.embedding_model.eval(), _example_inputs(model), path,
+                          input_names=["feats", "wav_lens"], output_names=["embeddings"],
+                          dynamic_axes={"feats": {0: "batch", 1: "frames"}, "wav_lens": {0: "batch"},
+                                        "embeddings": {0: "batch"}},
+                          opset_version=opset)
+    return path
+
+
+class _CalibrationReader:
+    """Feeds filterbank features of calibration clips to ONNX Runtime's static quantizer."""
+
+    def __init__(self, model, signals):
+        self.model = model
+        self.signals = iter(signals)
+
+    def get_next(self):
+        import torch
+
+        signal = next(self.signals, None)
+        if signal is None:
+            return None
+        wav_lens = torch.ones(1)
+        feats = EagerBackend(self.model).features(torch.from_numpy(signal).unsqueeze(0), wav_lens)
+        return {"feats": feats.numpy(), "wav_lens": wav_lens.numpy()}
+
+
+def export_onnx_int8(model, export_dir=EXPORT_DIR, mode="dynamic", calibration_signals=None):
+    """
+    Quantize the exported ONNX graph to int8 weights; returns the written path.
+
+    ``dynamic`` quantizes weights ahead of time and activations per batch at run time.
+    ``static`` also fixes activation ranges from ``calibration_signals`` (16 kHz float32
+    arrays), which is faster but only as good as the calibration audio. The float
+    graph is exported first if it does not exist yet.
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    source = os.path.join(export_dir, ONNX_FILE)
+    if not os.path.exists(source):
+        export_onnx(model, export_dir)
+    path = os.path.join(export_dir, ONNX_INT8_FILE)
+    if mode == "dynamic":
+        quantize_dynamic(source, path, op_types_to_quantize=["Conv", "MatMul", "Gemm"],
+                         weight_type=QuantType.QInt8)
+    elif mode == "static":
+        if not calibration_signals:
+            raise ValueError("Static quantization needs calibration_signals")
+        quantize_static(source, path, _CalibrationReader(model, calibration_signals),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QInt8,
+                        weight_type=QuantType.QInt8, per_channel=True)
+    else:
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected 'dynamic' or 'static'")
+    return path
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+from audio_io import TARGET_SAMPLE_RATE, array_to_mono
+from speaker_registry import l2_normalize
+
+# Latest verdict of the live verifier; audio_seconds is how much audio had arrived when it was made
+Decision = namedtuple("Decision", ["authorized", "similarity", "smoothed", "audio_seconds", "timestamp"])
+
+
+class RingBuffer:
+    """Preallocated float32 ring buffer written from an audio callback and read by a worker."""
+
+    def __init__(self, capacity):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._pos = 0
+        self.total = 0  # samples written since creation
+        self._lock = threading.Lock()
+
+    def write(self, frames):
+        frames = np.asarray(frames, dtype=np.float32).ravel()
+        capacity = len(self._data)
+        with self._lock:
+            self.total += len(frames)
+            if len(frames) >= capacity:
+                frames = frames[-capacity:]
+            first = min(len(frames), capacity - self._pos)
+            self._data[self._pos:self._pos + first] = frames[:first]
+            self._data[:len(frames) - first] = frames[first:]
+            self._pos = (self._pos + len(frames)) % capacity
+
+    def latest(self, n):
+        """Copy of the most recent n samples (fewer if not that many were written yet)."""
+        with self._lock:
+            n = min(n, len(self._data), self.total)
+            start = (self._pos - n) % len(self._data)
+            if start + n <= len(self._data):
+                return self._data[start:start + n].copy()
+            return np.concatenate([self._data[start:], self._data[:self._pos]])
+
+
+class LiveVerifier:
+    """
+    Continuous speaker verification over a live audio stream.
+
+    Audio frames are pushed with ``feed`` (or ``callback`` for sounddevice) into a
+    ring buffer. A background thread embeds the latest ``window_seconds`` every
+    ``hop_seconds`` and scores it against the enrolled speaker; the UI polls
+    ``latest()`` for the current decision. The first decision is made as soon as
+    ``min_seconds`` of audio is available.
+    """
+
+    def __init__(self, authorized_embedding_avg, sample_rate=TARGET_SAMPLE_RATE, threshold=0.75,
+                 window_seconds=2.0, hop_seconds=0.5, min_seconds=0.75, smoothing=4, embed_fn=None):
+        if embed_fn is None:
+            import app
+            embed_fn = app.get_embedding
+        self.embed_fn = embed_fn
+        self.reference = l2_normalize(authorized_embedding_avg)
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.window = int(window_seconds * sample_rate)
+        self.hop = int(hop_seconds * sample_rate)
+        self.min_samples = int(min_seconds * sample_rate)
+        self.ring = RingBuffer(self.window)
+        self._recent = deque(maxlen=smoothing)
+        self._decision = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.first_decision_at = None
+
+    def feed(self, frames):
+        """Push a block of int or float samples, mono or (frames, channels)."""
+        self.ring.write(array_to_mono(frames))
+        with self._cond:
+            self._cond.notify()
+
+    def callback(self, indata, frames, time_info, status):
+        """sounddevice.InputStream callback."""
+        self.feed(indata)
+
+    def latest(self):
+        """Most recent Decision, or None before the first one."""
+        return self._decision
+
+    def start(self):
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="live-verifier", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_at = self.min_samples
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self.ring.total >= next_at or self._stop.is_set(), timeout=0.5)
+            if self._stop.is_set():
+                return
+            total = self.ring.total
+            if total < next_at:
+                continue
+            window = self.ring.latest(self.window)
+            embedding = self.embed_fn(window, sample_rate=self.sample_rate)
+            similarity = float(l2_normalize(embedding) @ self.reference)
+            self._recent.append(similarity)
+            smoothed = float(np.mean(self._recent))
+            self._decision = Decision(smoothed >= self.threshold, similarity, smoothed,
+                                      total / self.sample_rate, time.perf_counter())
+            if self.first_decision_at is None:
+                self.first_decision_at = self._decision.timestamp
+            next_at = total + self.hop
+
+
+def replay(signal, verifier, sample_rate=TARGET_SAMPLE_RATE, block_seconds=0.02, realtime=True):
+    """Feed a recorded signal to a verifier block by block, as a microphone would."""
+    block = max(1, int(block_seconds * sample_rate))
+    start = time.perf_counter()
+    for i in range(0, len(signal), block):
+        verifier.feed(signal[i:i + block])
+        if realtime:
+            # Sleep until this block would have been captured
+            delay = (i + block) / sample_rate - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def replay_wav(source, verifier, block_seconds=0.02, realtime=True):
+    """Replay a WAV file (path, bytes or file-like) as a simulated 16 kHz input stream."""
+    from audio_io import load_audio_16k
+
+    replay(load_audio_16k(source), verifier, TARGET_SAMPLE_RATE, block_seconds, realtime)
+
+
+def open_microphone(verifier, device=None, block_seconds=0.02):
+    """Start a sounddevice input stream that feeds the verifier; call .stop()/.close() on it when done."""
+    import sounddevice as sd
+
+    stream = sd.InputStream(samplerate=verifier.sample_rate, channels=1, dtype="float32", device=device,
+                            blocksize=int(block_seconds * verifier.sample_rate), callback=verifier.callback)
+    stream.start()
+    return stream
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from functools import partial
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent embedding requests into padded batches.
+
+    ``submit`` queues a waveform already prepared by ``app.load_signal`` and returns
+    a Future. A background thread waits for the first request, keeps collecting
+    until ``max_wait_ms`` has passed or ``max_batch_size`` requests are queued, then
+    runs them through ``embed_fn`` as one batch and resolves each caller's Future
+    with its own row. By default ``embed_fn`` is ``app.get_embeddings`` with VAD
+    off, since the waveforms were already trimmed.
+    """
+
+    def __init__(self, embed_fn=None, max_batch_size=16, max_wait_ms=5.0):
+        if embed_fn is None:
+            import app
+            embed_fn = partial(app.get_embeddings, vad=False)
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._items = 0
+        self._max_queue_depth = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, waveform):
+        """Queue a waveform for embedding; the returned Future resolves to its embedding."""
+        future = Future()
+        self._queue.put((waveform, future))
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def embed(self, waveform):
+        """Blocking convenience wrapper around submit."""
+        return self.submit(waveform).result()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch, then stop on the next collect
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Callers that cancelled while queued do not need a forward pass
+            batch = [(w, f) for w, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                embeddings = self.embed_fn([waveform for waveform, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._items += len(batch)
+
+    def metrics(self):
+        """Queue depth and batch-size statistics since the batcher started."""
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "items": self._items,
+                "mean_batch_size": self._items / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            }
+
+    def close(self):
+        """Stop the worker after the requests already queued have been served."""
+        self._queue.put(_STOP)
+        self._thread.join()
@@ -3,29 +3,25 @@ import sounddevice as sd
 import numpy as np
 import wave
 import os
+import time
 import matplotlib.pyplot as plt
 from io import BytesIO
-from app import register_authorized_speaker, is_authorized_speaker
+from app import is_authorized_speaker
+from enrollment import BackgroundEnroller, streamlit_status
+from live import LiveVerifier, open_microphone
 
 # Constants
 AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
-TEMP_AUDIO_FOLDER = "temp_audio"  # Path to save uploaded and recorded audio files temporarily
 
-# Create temp_audio directory if it doesn't exist
-if not os.path.exists(TEMP_AUDIO_FOLDER):
-    os.makedirs(TEMP_AUDIO_FOLDER)
+# Register the authorized speaker on a background thread shared by every session, so the
+# page renders straight away; verification uses the latest finished enrollment
+@st.cache_resource
+def get_enroller():
+    return BackgroundEnroller().start({AUTHORIZED_USER_FOLDER: AUTHORIZED_USER_FOLDER})
 
-# Register the authorized speaker (this can be done once, or dynamically)
 authorized_embedding_avg = None
 if os.path.exists(AUTHORIZED_USER_FOLDER):
-    authorized_embedding_avg = register_authorized_speaker(AUTHORIZED_USER_FOLDER)
-    st.success("Authorized speaker registered!")
-
-def save_audio_file(audio_data, file_name):
-    file_path = os.path.join(TEMP_AUDIO_FOLDER, file_name)
-    with open(file_path, "wb") as f:
-        f.write(audio_data)
-    return file_path
+    authorized_embedding_avg, status = streamlit_status(get_enroller(), AUTHORIZED_USER_FOLDER)
 
 def record_audio(duration=5, samplerate=44100):
     """Record audio for a given duration and return the data and samplerate."""
@@ -35,13 +31,15 @@ def record_audio(duration=5, samplerate=44100):
     st.write("Recording finished.")
     return audio_data, samplerate
 
-def save_wav(filename, audio_data, samplerate):
-    """Save numpy array as a .wav file."""
-    with wave.open(filename, 'wb') as wf:
+def save_wav(audio_data, samplerate):
+    """Encode numpy array as in-memory .wav bytes."""
+    buf = BytesIO()
+    with wave.open(buf, 'wb') as wf:
         wf.setnchannels(1)
         wf.setsampwidth(2)  # Sample width in bytes
         wf.setframerate(samplerate)
         wf.writeframes(audio_data.tobytes())
+    return buf.getvalue()
 
 def plot_waveform(audio_data, samplerate):
     """Plot waveform of the audio data."""
@@ -64,20 +62,23 @@ if 'recorded_audio' not in st.session_state:
     st.session_state.recorded_audio = None
 if 'samplerate' not in st.session_state:
     st.session_state.samplerate = None
+if 'live_verifier' not in st.session_state:
+    st.session_state.live_verifier = None
+    st.session_state.live_stream = None
 
 # Handle file uploads or recording
 st.header("Test the Speaker Recognition System")
-option = st.selectbox("Choose an option", ("Upload an audio file", "Record your voice"))
+option = st.selectbox("Choose an option", ("Upload an audio file", "Record your voice", "Live verification"))
 
 if option == "Upload an audio file":
     uploaded_file = st.file_uploader("Upload an audio file to test", type=["wav", "mp3"])
 
     if uploaded_file is not None:
-        # Save the uploaded file to a temporary path
-        new_audio_path = save_audio_file(uploaded_file.read(), uploaded_file.name)
+        # Keep the upload in memory instead of writing it to disk
+        audio_bytes = uploaded_file.getvalue()
         
         if authorized_embedding_avg is not None:
-            is_authorized, similarity = is_authorized_speaker(new_audio_path, authorized_embedding_avg)
+            is_authorized, similarity = is_authorized_speaker(audio_bytes, authorized_embedding_avg)
             
             if is_authorized:
                 st.success(f"Authorized speaker detected! Similarity score: {similarity:.2f}")
@@ -85,43 +86,67 @@ if option == "Upload an audio file":
                 st.error(f"Unknown speaker detected. Similarity score: {similarity:.2f}")
         
         # Playback
-        st.audio(new_audio_path, format='audio/wav')
-        
-        # Clean up the temporary file
-        os.remove(new_audio_path)
+        st.audio(audio_bytes, format='audio/wav')
 
 elif option == "Record your voice":
     if st.button("Start Recording"):
         with st.spinner("Recording in progress..."):
             audio_data, samplerate = record_audio(duration=5)
-            temp_audio_path = os.path.join(TEMP_AUDIO_FOLDER, "recorded_audio.wav")
-            save_wav(temp_audio_path, audio_data, samplerate)
             
             st.write("Recording complete!")
-            st.session_state.recorded_audio = temp_audio_path
+            st.session_state.recorded_audio = audio_data
             st.session_state.samplerate = samplerate
             
             # Playback
-            st.audio(temp_audio_path, format='audio/wav')
+            st.audio(save_wav(audio_data, samplerate), format='audio/wav')
             
             # Plot waveform
             waveform_plot = plot_waveform(audio_data, samplerate)
             st.image(waveform_plot, caption="Audio Waveform")
 
-    if st.session_state.recorded_audio:
+    if st.session_state.recorded_audio is not None:
         if st.button("Test Recorded Audio"):
             if authorized_embedding_avg is not None:
-                is_authorized, similarity = is_authorized_speaker(st.session_state.recorded_audio, authorized_embedding_avg)
+                is_authorized, similarity = is_authorized_speaker(st.session_state.recorded_audio, authorized_embedding_avg, sample_rate=st.session_state.samplerate)
                 
                 if is_authorized:
                     st.success(f"Authorized speaker detected! Similarity score: {similarity:.2f}")
                 else:
                     st.error(f"Unknown speaker detected. Similarity score: {similarity:.2f}")
 
-        # Clean up the temporary file after testing
+        # Drop the recorded audio from the session
         if st.button("Clear"):
-            if st.session_state.recorded_audio and os.path.exists(st.session_state.recorded_audio):
-                os.remove(st.session_state.recorded_audio)
             st.session_state.recorded_audio = None
             st.session_state.samplerate = None
             st.write("Cleared recorded audio.")
+
+elif option == "Live verification":
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Start Listening") and st.session_state.live_verifier is None and authorized_embedding_avg is not None:
+            # Microphone frames go into a ring buffer; a background thread scores rolling windows
+            verifier = LiveVerifier(authorized_embedding_avg).start()
+            st.session_state.live_verifier = verifier
+            st.session_state.live_stream = open_microphone(verifier)
+    
+    with col2:
+        if st.button("Stop Listening") and st.session_state.live_verifier is not None:
+            st.session_state.live_stream.stop()
+            st.session_state.live_stream.close()
+            st.session_state.live_verifier.stop()
+            st.session_state.live_verifier = None
+            st.session_state.live_stream = None
+    
+    if st.session_state.live_verifier is not None:
+        decision = st.session_state.live_verifier.latest()
+        if decision is None:
+            st.write("Listening...")
+        elif decision.authorized:
+            st.success(f"Authorized speaker detected! Similarity score: {decision.smoothed:.2f}")
+        else:
+            st.error(f"Unknown speaker detected. Similarity score: {decision.smoothed:.2f}")
+        
+        # Poll the verifier for a fresh decision
+        time.sleep(0.25)
+        st.rerun()
@@ -0,0 +1,201 @@
+"""
+Per-stage timing of the verification hot path.
+
+Instrumented code wraps each stage in ``with profiling.stage("encode", audio_seconds):``.
+Profiling is off unless SPKREC_PROFILE=1 is set or ``enable()`` is called. While it
+is off, ``stage`` returns one shared no-op context manager, so the hot path pays a
+flag check and nothing is timed, recorded or allocated.
+
+When it is on, every stage updates a call counter, an error counter and a duration
+histogram. Stages that process audio also add to a total of audio seconds and to a
+histogram of the real-time factor (compute seconds per audio second). Results are
+available as a dict (``snapshot``), in the Prometheus text exposition format
+(``render_prometheus``), and, with SPKREC_PROFILE_LOG=1, as one JSON log line per
+stage on the ``speaker_recognition.profile`` logger.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Constants
+METRIC_PREFIX = "spkrec_stage"
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REALTIME_FACTOR_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+ENABLED = os.environ.get("SPKREC_PROFILE", "") == "1"
+LOG = os.environ.get("SPKREC_PROFILE_LOG", "") == "1"
+logger = logging.getLogger("speaker_recognition.profile")
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (bucket ``le`` counts values <= le)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(le, count) pairs including +Inf."""
+        total, pairs = 0, []
+        for le, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((le, total))
+        return pairs
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = Histogram(DURATION_BUCKETS)
+        self.audio_seconds = 0.0
+        self.realtime_factor = Histogram(REALTIME_FACTOR_BUCKETS)
+
+
+class _NullStage:
+    """What ``stage`` returns while profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def audio(self, seconds):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("name", "audio_seconds", "start")
+
+    def __init__(self, name, audio_seconds):
+        self.name = name
+        self.audio_seconds = audio_seconds
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.start, self.audio_seconds, failed=exc_type is not None)
+        return False
+
+    def audio(self, seconds):
+        """Set the audio duration once it is known (e.g. after decoding)."""
+        self.audio_seconds = seconds
+
+
+def stage(name, audio_seconds=None):
+    """Context manager timing one stage; ``audio_seconds`` is the audio it processed, if any."""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name, audio_seconds)
+
+
+def record(name, seconds, audio_seconds=None, failed=False):
+    """Add one measurement of a stage (for callers that time things themselves)."""
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = StageStats()
+        stats.calls += 1
+        stats.errors += failed
+        stats.seconds.observe(seconds)
+        if audio_seconds:
+            stats.audio_seconds += audio_seconds
+            stats.realtime_factor.observe(seconds / audio_seconds)
+    if LOG:
+        logger.info(json.dumps({"stage": name, "seconds": round(seconds, 6), "audio_seconds": audio_seconds,
+                                "failed": failed, "thread": threading.current_thread().name}))
+
+
+def enable(enabled=True, log=None):
+    """Turn profiling (and optionally structured stage logs) on or off at run time."""
+    global ENABLED, LOG
+    ENABLED = enabled
+    if log is not None:
+        LOG = log
+
+
+def reset():
+    """Forget every measurement."""
+    with _lock:
+        _stats.clear()
+
+
+def snapshot():
+    """Per-stage calls, errors, total/mean seconds and audio seconds processed."""
+    with _lock:
+        return {
+            name: {
+                "calls": s.calls,
+                "errors": s.errors,
+                "seconds": s.seconds.sum,
+                "mean_ms": s.seconds.sum / s.calls * 1000 if s.calls else 0.0,
+                "audio_seconds": s.audio_seconds,
+                "realtime_factor": s.seconds.sum / s.audio_seconds if s.audio_seconds else None,
+            }
+            for name, s in sorted(_stats.items())
+        }
+
+
+def _histogram_lines(metric, name, histogram):
+    lines = [f'{metric}_bucket{{stage="{name}",le="{"+Inf" if le == float("inf") else repr(le)}"}} {count}'
+             for le, count in histogram.cumulative()]
+    lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum!r}')
+    lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+    return lines
+
+
+def render_prometheus():
+    """All stage metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        items = sorted(_stats.items())
+        lines = [
+            f"# HELP {METRIC_PREFIX}_calls_total Stage executions.",
+            f"# TYPE {METRIC_PREFIX}_calls_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_calls_total{{stage="{name}"}} {s.calls}' for name, s in items]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_errors_total Stage executions that raised.",
+            f"# TYPE {METRIC_PREFIX}_errors_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_errors_total{{stage="{name}"}} {s.errors}' for name, s in items]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_seconds Wall time spent in the stage.",
+            f"# TYPE {METRIC_PREFIX}_seconds histogram",
+        ]
+        for name, s in items:
+            lines += _histogram_lines(f"{METRIC_PREFIX}_seconds", name, s.seconds)
+        lines += [
+            f"# HELP {METRIC_PREFIX}_audio_seconds_total Seconds of audio the stage processed.",
+            f"# TYPE {METRIC_PREFIX}_audio_seconds_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_audio_seconds_total{{stage="{name}"}} {s.audio_seconds!r}'
+                  for name, s in items if s.realtime_factor.count]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_realtime_factor Compute seconds per second of audio.",
+            f"# TYPE {METRIC_PREFIX}_realtime_factor histogram",
+        ]
+        for name, s in items:
+            if s.realtime_factor.count:
+                lines += _histogram_lines(f"{METRIC_PREFIX}_realtime_factor", name, s.realtime_factor)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,178 @@
+"""
+Adaptive score normalization (S-norm / AS-norm) against an impostor cohort.
+
+Raw cosine scores drift with channel and recording conditions. AS-norm rescales a trial
+score by how its enrollment and its test embedding each score against the cohort
+speakers most similar to them:
+
+    s_norm = ((s - mu_e) / sigma_e + (s - mu_t) / sigma_t) / 2
+
+where mu and sigma are the mean and standard deviation of the top-k cohort scores. With
+``top_k=None`` the whole cohort is used, which is plain S-norm. The cohort is embedded
+once into a float32 ``.npy`` that is memory-mapped, so worker processes share one copy.
+Statistics of enrolled speakers are cached, which leaves one matrix-vector product and
+one partial sort per request for the test side.
+
+Normalized scores are not on the cosine scale, so the threshold has to be chosen for
+them: ``python evaluate.py --cohort cohort/embeddings.npy`` reports EER and minDCF on
+normalized scores.
+
+Usage:
+    python score_norm.py COHORT_DIR [-o cohort/embeddings.npy] [--batch-size 16]
+"""
+import argparse
+import json
+import os
+import threading
+import numpy as np
+from speaker_registry import l2_normalize, top_k
+
+# Constants
+COHORT_PATH = "cohort/embeddings.npy"  # Where the embedded cohort is kept
+TOP_K = 200  # Cohort scores per side used for the statistics (None for S-norm)
+DEFAULT_THRESHOLD = 3.0  # Starting point for normalized scores; calibrate with evaluate.py --cohort
+
+
+def _meta_path(path):
+    return f"{os.path.splitext(path)[0]}.json"
+
+
+def build_cohort(folder, output=COHORT_PATH, batch_size=16):
+    """Embed every clip under ``folder`` into a normalized (M, D) float32 matrix saved at ``output``."""
+    import app
+    from batch_score import list_inputs
+    from embedding_store import MODEL_DIR, model_fingerprint
+
+    files = list_inputs(folder)
+    embeddings = l2_normalize(app.get_embeddings(files, batch_size=batch_size))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    tmp_path = f"{output}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, embeddings)
+    os.replace(tmp_path, output)
+    with open(_meta_path(output), "w") as f:
+        json.dump({"model": model_fingerprint(MODEL_DIR, app.pipeline_id()), "files": files}, f, indent=1)
+    return embeddings
+
+
+class ScoreNormalizer:
+    """
+    AS-norm (or S-norm with ``top_k=None``) over a cohort of normalized embeddings.
+
+    ``speaker_stats`` caches the cohort statistics of each enrolled speaker together
+    with the centroid they were computed for, so a re-enrolled speaker is recomputed
+    on its next request and every other one is served from the cache. ``identify``
+    also keeps them as arrays aligned with the registry's rows, rebuilt only when the
+    registry's version changes.
+    """
+
+    def __init__(self, cohort, top_k=TOP_K):
+        self.cohort = cohort
+        self.top_k = top_k if top_k and top_k < len(cohort) else None
+        self._speakers = {}
+        # (registry version, mean, std) for identify
+        self._rows = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=COHORT_PATH, top_k=TOP_K, model_id=None):
+        """
+        Memory-map a cohort written by ``build_cohort``.
+
+        If ``model_id`` is given it must match the fingerprint the cohort was embedded
+        with; cohort scores from another model or pipeline are meaningless.
+        """
+        if model_id is not None:
+            with open(_meta_path(path)) as f:
+                if json.load(f).get("model") != model_id:
+                    raise ValueError(f"Cohort {path} was embedded with a different model or pipeline; rebuild it")
+        return cls(np.load(path, mmap_mode="r"), top_k)
+
+    def cohort_stats(self, embeddings):
+        """Mean and std of the top-k cohort scores of each embedding (1-D or 2-D input)."""
+        single = np.ndim(embeddings) == 1
+        scores = np.atleast_2d(l2_normalize(embeddings)) @ self.cohort.T
+        if self.top_k is not None:
+            scores = np.partition(scores, -self.top_k, axis=1)[:, -self.top_k:]
+        mean, std = scores.mean(axis=1), np.maximum(scores.std(axis=1), 1e-6)
+        if single:
+            return float(mean[0]), float(std[0])
+        return mean, std
+
+    def speaker_stats(self, speaker_id, centroid):
+        """Cohort statistics of an enrolled speaker, cached until its centroid changes."""
+        with self._lock:
+            cached = self._speakers.get(speaker_id)
+        if cached is not None and np.array_equal(cached[0], centroid):
+            return cached[1]
+        stats = self.cohort_stats(centroid)
+        with self._lock:
+            self._speakers[speaker_id] = (np.array(centroid, dtype=np.float32), stats)
+        return stats
+
+    def row_stats(self, registry):
+        """Cohort (mean, std) arrays aligned with the registry's rows, cached until it changes."""
+        with self._lock:
+            cached = self._rows
+        if cached is not None and cached[0] == registry.version:
+            return cached[1], cached[2]
+        version, speakers, centroids = registry.version, registry.speakers, registry.centroids.copy()
+        mean, std = np.empty(len(speakers)), np.empty(len(speakers))
+        stale = []
+        with self._lock:
+            for row, speaker_id in enumerate(speakers):
+                entry = self._speakers.get(speaker_id)
+                if entry is not None and np.array_equal(entry[0], centroids[row]):
+                    mean[row], std[row] = entry[1]
+                else:
+                    stale.append(row)
+        if stale:
+            # Speakers added or re-enrolled since the last rebuild, in one matrix product
+            mean[stale], std[stale] = self.cohort_stats(centroids[stale])
+            with self._lock:
+                for row in stale:
+                    self._speakers[speakers[row]] = (centroids[row], (float(mean[row]), float(std[row])))
+        with self._lock:
+            self._rows = (version, mean, std)
+        return mean, std
+
+    def forget(self, speaker_id):
+        """Drop a speaker's cached statistics."""
+        with self._lock:
+            self._speakers.pop(speaker_id, None)
+
+    @staticmethod
+    def normalize(raw, enroll_stats, test_stats):
+        """Symmetric normalization of raw scores (scalars or arrays) given both sides' (mean, std)."""
+        (enroll_mean, enroll_std), (test_mean, test_std) = enroll_stats, test_stats
+        return 0.5 * ((raw - enroll_mean) / enroll_std + (raw - test_mean) / test_std)
+
+    def score(self, enrollment, test, speaker_id=None):
+        """Normalized score of one trial; the enrollment side is cached under ``speaker_id``."""
+        enrollment, test = l2_normalize(enrollment), l2_normalize(test)
+        if speaker_id is None:
+            enroll_stats = self.cohort_stats(enrollment)
+        else:
+            enroll_stats = self.speaker_stats(speaker_id, enrollment)
+        return float(self.normalize(float(enrollment @ test), enroll_stats, self.cohort_stats(test)))
+
+    def identify(self, registry, embedding, k=1):
+        """Like SpeakerRegistry.identify, ranked by normalized score."""
+        speakers = registry.speakers
+        raw = registry.scores(embedding)
+        normalized = self.normalize(raw, self.row_stats(registry), self.cohort_stats(embedding))
+        return [(speakers[i], float(normalized[i])) for i in top_k(normalized, k)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cohort", help="Directory (or manifest) of impostor clips, ideally many speakers")
+    parser.add_argument("-o", "--output", default=COHORT_PATH)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    embeddings = build_cohort(args.cohort, args.output, args.batch_size)
+    print(f"embedded {len(embeddings)} cohort clips into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Headless HTTP speaker verification service.
+
+The model is loaded once per worker process and shared by every request. Audio is
+sent as the raw request body (WAV, or any format librosa can read) and decoded in memory.
+
+Endpoints:
+    POST /enroll?speaker=<id>            add the clip to a speaker's enrollment
+    GET  /samples?speaker=<id>           leave-one-out similarity of each enrollment sample
+    POST /verify?speaker=<id>[&threshold=0.75]
+    POST /identify[?k=5]
+    POST /reenroll                       re-run folder enrollment in the background
+    GET  /health                         includes background enrollment progress
+    GET  /metrics                        micro-batching statistics and per-stage timings (JSON)
+    GET  /metrics?format=prometheus      per-stage timings in the Prometheus text format
+
+Run it standalone with the built-in asyncio server:
+    python service.py --port 8000 [--workers 2] [--batch-size 16 --batch-wait-ms 5] [--profile]
+                      [--score-norm --norm-threshold 3.0] [--index ivf --nprobe 8]
+or under any ASGI server, e.g. ``uvicorn service:application``.
+
+Each worker process enrolls the configured folders into its own registry, so with
+``--workers > 1`` the service is read-only: /enroll and /reenroll answer 403 because a
+mutation would reach only the one worker the kernel routed it to. Run a single worker
+to enroll over HTTP.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import app
+import profiling
+from ann_index import IVFIndex
+from enrollment import BackgroundEnroller
+from micro_batcher import MicroBatcher
+from score_norm import DEFAULT_THRESHOLD
+from speaker_registry import SpeakerRegistry
+
+# Constants
+AUTHORIZED_USER_FOLDER = "authenticated_user"  # Path to the authorized speaker folder
+MAX_BODY_BYTES = 20 * 1024 * 1024  # Reject uploads larger than this
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+METHODS = {"/enroll": "POST", "/samples": "GET", "/verify": "POST", "/identify": "POST", "/reenroll": "POST",
+           "/health": "GET", "/metrics": "GET"}
+MUTATING = ("/enroll", "/reenroll")  # Rejected in read-only (multi-worker) mode
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class VerificationService:
+    """
+    ASGI application serving enroll/verify/identify against one in-process registry.
+
+    Folder enrollment runs in the background (see enrollment.py): requests are served
+    from the previous registry until the new one is swapped in.
+
+    With ``read_only=True`` the mutating endpoints (/enroll, /reenroll) answer 403. The
+    standalone server sets it for ``--workers > 1``: every worker holds its own registry
+    built from the same folders, and a mutation would only reach the worker the kernel
+    happened to route it to.
+    """
+
+    def __init__(self, registry=None, threshold=0.75, max_workers=2, max_pending=64, batcher=None,
+                 normalizer=None, norm_threshold=DEFAULT_THRESHOLD, read_only=False):
+        self.enroller = BackgroundEnroller(registry)
+        self.read_only = read_only
+        self.folders = {}
+        self.threshold = threshold
+        # Optional ScoreNormalizer; when set, decisions use the AS-norm score and norm_threshold
+        self.normalizer = normalizer
+        self.norm_threshold = norm_threshold
+        # Optional MicroBatcher that coalesces concurrent requests into one forward pass
+        self.batcher = batcher
+        # Inference runs on a small thread pool so the event loop never blocks on the model;
+        # the semaphore bounds how many requests may wait for it
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+        self._max_pending = max_pending
+        self._slots = None
+
+    @property
+    def registry(self):
+        return self.enroller.registry
+
+    def enroll_folders(self, folders):
+        """Start (re-)enrolling ``{speaker_id: folder}`` in the background; returns the enroller."""
+        self.folders.update(folders)
+        return self.enroller.start(self.folders)
+
+    def _require_enrolled(self, registry, speaker_id):
+        if speaker_id not in registry:
+            if self.enroller.status().running:
+                raise HTTPError(503, f"Enrollment in progress, speaker not available yet: {speaker_id}")
+            raise HTTPError(404, f"Speaker not enrolled: {speaker_id}")
+
+    async def embed(self, audio_bytes):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            if self.batcher is None:
+                return await loop.run_in_executor(self._executor, app.get_embedding, audio_bytes)
+            signal = await loop.run_in_executor(self._executor, app.load_signal, audio_bytes)
+            return await asyncio.wrap_future(self.batcher.submit(signal))
+
+    async def handle_enroll(self, params, body):
+        speaker_id = _require(params, "speaker")
+        embedding = await self.embed(body)
+        # Uploads are keyed by content, so re-sending a clip does not count it twice
+        sample = hashlib.blake2b(body, digest_size=8).hexdigest()
+        # Copying the registry is O(gallery), so it runs off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.enroller.mutate,
+                                   lambda registry: registry.add_sample(speaker_id, sample, embedding))
+        return {"speaker": speaker_id, "sample": sample, "samples": len(self.registry.samples(speaker_id))}
+
+    def handle_samples(self, params):
+        speaker_id = _require(params, "speaker")
+        registry = self.registry
+        self._require_enrolled(registry, speaker_id)
+        return {"speaker": speaker_id, "samples": registry.contributions(speaker_id)}
+
+    def handle_reenroll(self):
+        if not self.folders:
+            raise HTTPError(400, "No enrollment folders configured")
+        try:
+            self.enroller.start(self.folders)
+        except RuntimeError as e:
+            raise HTTPError(409, str(e))
+        return self.enroller.status()._asdict()
+
+    async def handle_verify(self, params, body):
+        speaker_id = _require(params, "speaker")
+        self._require_enrolled(self.registry, speaker_id)
+        embedding = await self.embed(body)
+        # The registry may have been swapped while we waited for the model
+        registry = self.registry
+        self._require_enrolled(registry, speaker_id)
+        with profiling.stage("score"):
+            similarity = registry.score(speaker_id, embedding)
+        if self.normalizer is None:
+            threshold = float(params.get("threshold", self.threshold))
+            return {"speaker": speaker_id, "authorized": similarity >= threshold, "similarity": similarity}
+        threshold = float(params.get("threshold", self.norm_threshold))
+        with profiling.stage("score_norm"):
+            normalized = self.normalizer.score(registry.get(speaker_id), embedding, speaker_id)
+        return {"speaker": speaker_id, "authorized": normalized >= threshold, "similarity": similarity,
+                "normalized": normalized}
+
+    async def handle_identify(self, params, body):
+        k = int(params.get("k", 5))
+        embedding = await self.embed(body)
+        registry = self.registry
+        with profiling.stage("identify"):
+            if self.normalizer is None:
+                matches = registry.identify(embedding, k=k)
+            else:
+                matches = self.normalizer.identify(registry, embedding, k=k)
+        return {"matches": [{"speaker": s, "similarity": score} for s, score in matches]}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                return await _send_json(send, 413, {"error": "Request body too large"})
+            if not message.get("more_body"):
+                break
+
+        params = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+        routes = {
+            "/enroll": self.handle_enroll,
+            "/verify": self.handle_verify,
+            "/identify": self.handle_identify,
+        }
+        path = scope["path"]
+        try:
+            if path not in METHODS:
+                raise HTTPError(404, f"Unknown endpoint: {path}")
+            if scope["method"] != METHODS[path]:
+                raise HTTPError(405, f"Use {METHODS[path]}")
+            if self.read_only and path in MUTATING:
+                raise HTTPError(403, "Enrollment over HTTP is disabled when serving with several workers; "
+                                     "enroll from folders and restart the service")
+            if path == "/health":
+                status, payload = 200, {"status": "ok", "speakers": len(self.registry),
+                                        "enrollment": self.enroller.status()._asdict()}
+            elif path == "/metrics" and params.get("format") == "prometheus":
+                return await _send_text(send, 200, profiling.render_prometheus())
+            elif path == "/metrics":
+                status, payload = 200, {"batching": self.batcher.metrics() if self.batcher else {},
+                                        "stages": profiling.snapshot()}
+            elif path == "/samples":
+                status, payload = 200, self.handle_samples(params)
+            elif path == "/reenroll":
+                status, payload = 200, self.handle_reenroll()
+            elif not body:
+                raise HTTPError(400, "Request body must contain audio")
+            else:
+                status, payload = 200, await routes[path](params, body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except ValueError as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            # Undecodable audio surfaces from librosa/soundfile as assorted exception types
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        await _send_json(send, status, payload)
+
+
+def _require(params, name):
+    if not params.get(name):
+        raise HTTPError(400, f"Missing query parameter: {name}")
+    return params[name]
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_text(send, status, text):
+    body = text.encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; version=0.0.4"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _handle_connection(reader, writer, asgi_app):
+    """Minimal HTTP/1.1 front-end (Content-Length bodies, keep-alive) for an ASGI app."""
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, version = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            path, _, query = target.partition("?")
+            length = int(headers.get("content-length", 0))
+
+            if length > MAX_BODY_BYTES:
+                body, keep_alive = b"", False
+                status, response_headers, chunks = 413, [(b"content-type", b"application/json")], \
+                    [json.dumps({"error": "Request body too large"}).encode()]
+            else:
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                response = {"status": 500, "headers": [], "chunks": []}
+
+                async def receive():
+                    return {"type": "http.request", "body": body, "more_body": False}
+
+                async def send(message):
+                    if message["type"] == "http.response.start":
+                        response["status"] = message["status"]
+                        response["headers"] = message.get("headers", [])
+                    else:
+                        response["chunks"].append(message.get("body", b""))
+
+                scope = {"type": "http", "method": method.upper(), "path": path,
+                         "query_string": query.encode(), "http_version": version[5:],
+                         "headers": [(k.encode(), v.encode()) for k, v in headers.items()]}
+                await asgi_app(scope, receive, send)
+                status, response_headers, chunks = response["status"], response["headers"], response["chunks"]
+
+            payload = b"".join(chunks)
+            lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+            lines += [f"{k.decode()}: {v.decode()}" for k, v in response_headers if k.lower() != b"content-length"]
+            lines += [f"Content-Length: {len(payload)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+def create_service(authorized_folder=AUTHORIZED_USER_FOLDER, speakers_folder=None, **kwargs):
+    """
+    Build a service that enrolls the authorized speaker and/or a folder of speakers.
+
+    Enrollment runs in the background, so the service can take requests straight away;
+    ``service.enroller.wait()`` blocks until it is done.
+    """
+    service = VerificationService(**kwargs)
+    folders = {}
+    if authorized_folder and os.path.isdir(authorized_folder):
+        folders[os.path.basename(os.path.normpath(authorized_folder))] = authorized_folder
+    if speakers_folder and os.path.isdir(speakers_folder):
+        for speaker_id in sorted(os.listdir(speakers_folder)):
+            speaker_folder = os.path.join(speakers_folder, speaker_id)
+            if os.path.isdir(speaker_folder) and os.listdir(speaker_folder):
+                folders[speaker_id] = speaker_folder
+    if folders:
+        service.enroll_folders(folders)
+    return service
+
+
+async def serve(asgi_app, host="127.0.0.1", port=8000, reuse_port=False):
+    server = await asyncio.start_server(lambda r, w: _handle_connection(r, w, asgi_app),
+                                        host, port, reuse_port=reuse_port, limit=64 * 1024)
+    print(f"[{os.getpid()}] Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def _run_worker(args):
+    if args.profile:
+        profiling.enable(log=args.profile_log)
+        if args.profile_log:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+    app.warmup()
+    batcher = None
+    if args.batch_size > 1:
+        batcher = MicroBatcher(max_batch_size=args.batch_size, max_wait_ms=args.batch_wait_ms)
+    normalizer = app.get_score_normalizer() if args.score_norm else None
+    # With an IVF index, /identify probes nprobe clusters instead of scanning every speaker
+    registry = SpeakerRegistry(index=IVFIndex(nprobe=args.nprobe)) if args.index == "ivf" else None
+    service = create_service(args.authorized_folder, args.speakers_folder, registry=registry,
+                             threshold=args.threshold, max_workers=args.threads, max_pending=args.max_pending,
+                             batcher=batcher, normalizer=normalizer, norm_threshold=args.norm_threshold,
+                             read_only=args.workers > 1)
+    asyncio.run(serve(service, args.host, args.port, reuse_port=args.workers > 1))
+
+
+def __getattr__(name):
+    # ASGI entry point for external servers (uvicorn service:application),
+    # built lazily so importing this module does not enroll anything
+    global application
+    if name == "application":
+        app.warmup()
+        application = create_service()
+        return application
+    raise AttributeError(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes, each with its own warm model and registry (more than one is read-only)")
+    parser.add_argument("--threads", type=int, default=2, help="Inference threads per worker")
+    parser.add_argument("--max-pending", type=int, default=64, help="Requests allowed to wait for inference")
+    parser.add_argument("--batch-size", type=int, default=1, help="Coalesce up to this many requests (1 disables)")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0, help="How long a batch may wait to fill")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--authorized-folder", default=AUTHORIZED_USER_FOLDER)
+    parser.add_argument("--speakers-folder", default=None, help="One subfolder of clips per speaker")
+    parser.add_argument("--index", choices=["brute", "ivf"], default="brute",
+                        help="How /identify searches the registry (ivf for very large galleries)")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF clusters searched per query")
+    parser.add_argument("--score-norm", action="store_true",
+                        help="Decide on AS-norm scores against app.SCORE_NORM_COHORT (see score_norm.py)")
+    parser.add_argument("--norm-threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--profile", action="store_true", help="Record per-stage timings (see profiling.py)")
+    parser.add_argument("--profile-log", action="store_true", help="Also log every stage as a JSON line")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        _run_worker(args)
+        return
+    workers = [multiprocessing.Process(target=_run_worker, args=(args,)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Speaker registry partitioned across worker processes on one machine.
+
+Each shard owns a slice of the centroid matrix in a ``multiprocessing.shared_memory``
+block and is served by its own process, so a gallery too large for one process to scan
+fast enough is scanned by all shards in parallel. The coordinator (the process that
+creates the ``ShardedRegistry``) keeps the speaker id -> (shard, row) map, writes
+centroids straight into the shared blocks, and answers ``identify`` by scattering the
+query to every shard over a pipe (a local socket pair), gathering each shard's top-k
+and merging them. Queries and results are a few hundred bytes; the matrix is never
+copied between processes.
+
+Shards are balanced by sending each new speaker to the emptiest one. Removal moves the
+shard's last row into the hole, as in SpeakerRegistry. Searches and mutations are
+serialized by one lock, so a shard never scans a row while it is being written.
+"""
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+from speaker_registry import l2_normalize, top_k
+
+
+def _attach(name, capacity, dim):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray((capacity, dim), dtype=np.float32, buffer=block.buf)
+
+
+def _shard_worker(conn, name, capacity, dim):
+    """Serve searches over one shard until told to stop."""
+    block, matrix = _attach(name, capacity, dim)
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "search":
+                _, n_rows, k, queries = message
+                scores = queries @ matrix[:n_rows].T
+                best = [top_k(row, k) for row in scores]
+                conn.send(([row[idx] for row, idx in zip(scores, best)], best))
+            elif message[0] == "attach":
+                # The coordinator grew this shard into a new block
+                del matrix
+                block.close()
+                _, name, capacity = message
+                block, matrix = _attach(name, capacity, dim)
+                conn.send("attached")
+            else:
+                break
+    finally:
+        del matrix
+        block.close()
+
+
+class _Shard:
+    """Coordinator-side handle of one shard: its block, rows, ids and worker."""
+
+    def __init__(self, context, dim, capacity):
+        self.dim = dim
+        self.block = shared_memory.SharedMemory(create=True, size=capacity * dim * 4)
+        self.matrix = np.ndarray((capacity, dim), dtype=np.float32, buffer=self.block.buf)
+        self.ids = []
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_shard_worker, args=(child_conn, self.block.name, capacity, dim),
+                                       name="registry-shard", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def grow(self):
+        """Double the block; the worker re-attaches before the old one is freed."""
+        old_block, old_matrix = self.block, self.matrix
+        capacity = 2 * len(old_matrix)
+        self.block = shared_memory.SharedMemory(create=True, size=capacity * self.dim * 4)
+        self.matrix = np.ndarray((capacity, self.dim), dtype=np.float32, buffer=self.block.buf)
+        self.matrix[:len(self.ids)] = old_matrix[:len(self.ids)]
+        self.conn.send(("attach", self.block.name, capacity))
+        self.conn.recv()
+        del old_matrix
+        old_block.close()
+        old_block.unlink()
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(("stop",))
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.conn.close()
+        del self.matrix
+        self.block.close()
+        self.block.unlink()
+
+
+class ShardedRegistry:
+    """
+    SpeakerRegistry-like registry whose centroids are spread over ``num_shards`` processes.
+
+    Call ``close`` (or use it as a context manager) to stop the workers and free the
+    shared memory; using it afterwards raises RuntimeError.
+    """
+
+    def __init__(self, num_shards=4, dim=192, capacity=1024):
+        self.dim = dim
+        # Spawned workers do not inherit the coordinator's threads, models or locks
+        context = multiprocessing.get_context("spawn")
+        self._shards = [_Shard(context, dim, max(1, capacity)) for _ in range(num_shards)]
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @classmethod
+    def from_registry(cls, registry, num_shards=4):
+        """Shard the speakers of a SpeakerRegistry."""
+        sharded = cls(num_shards, registry.dim, capacity=len(registry) // num_shards + 1)
+        for speaker_id, centroid in zip(registry.speakers, registry.centroids):
+            sharded.add(speaker_id, centroid)
+        return sharded
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.close()
+            self._shards = []
+            self._rows = {}
+            self._closed = True
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("registry is closed")
+
+    @property
+    def num_shards(self):
+        return len(self._shards)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, speaker_id):
+        return speaker_id in self._rows
+
+    @property
+    def speakers(self):
+        return [speaker_id for shard in self._shards for speaker_id in shard.ids]
+
+    def shard_sizes(self):
+        return [len(shard.ids) for shard in self._shards]
+
+    def add(self, speaker_id, embedding):
+        """Enroll a speaker on the emptiest shard, or replace its centroid if it is already enrolled."""
+        with self._lock:
+            self._check_open()
+            if speaker_id in self._rows:
+                shard, row = self._rows[speaker_id]
+                self._shards[shard].matrix[row] = l2_normalize(embedding)
+                return
+            index = min(range(len(self._shards)), key=lambda i: len(self._shards[i].ids))
+            shard = self._shards[index]
+            if len(shard.ids) == len(shard.matrix):
+                shard.grow()
+            row = len(shard.ids)
+            shard.matrix[row] = l2_normalize(embedding)
+            shard.ids.append(speaker_id)
+            self._rows[speaker_id] = (index, row)
+
+    def update(self, speaker_id, embedding):
+        """Replace the centroid of an enrolled speaker in place."""
+        with self._lock:
+            self._check_open()
+            shard, row = self._rows[speaker_id]
+            self._shards[shard].matrix[row] = l2_normalize(embedding)
+
+    def remove(self, speaker_id):
+        """Unenroll a speaker by moving its shard's last row into its slot."""
+        with self._lock:
+            self._check_open()
+            index, row = self._rows.pop(speaker_id)
+            shard = self._shards[index]
+            last = len(shard.ids) - 1
+            if row != last:
+                moved_id = shard.ids[last]
+                shard.matrix[row] = shard.matrix[last]
+                shard.ids[row] = moved_id
+                self._rows[moved_id] = (index, row)
+            shard.ids.pop()
+
+    def get(self, speaker_id):
+        """Return a copy of the normalized centroid of a speaker."""
+        with self._lock:
+            self._check_open()
+            shard, row = self._rows[speaker_id]
+            return self._shards[shard].matrix[row].copy()
+
+    def score(self, speaker_id, embedding):
+        """Cosine similarity between an embedding and one enrolled speaker."""
+        return float(self.get(speaker_id) @ l2_normalize(embedding))
+
+    def search(self, embeddings, k=1):
+        """For each of a batch of embeddings, the k most similar speakers as (speaker_id, similarity)."""
+        queries = np.atleast_2d(l2_normalize(embeddings))
+        with self._lock:
+            self._check_open()
+            # Scatter to every shard first so they all scan at once, then gather
+            busy = [shard for shard in self._shards if shard.ids]
+            for shard in busy:
+                shard.conn.send(("search", len(shard.ids), k, queries))
+            gathered = [(shard, shard.conn.recv()) for shard in busy]
+            results = []
+            for q in range(len(queries)):
+                ids = [shard.ids[row] for shard, (_, rows) in gathered for row in rows[q]]
+                scores = np.concatenate([scores[q] for _, (scores, _) in gathered]) if gathered else np.empty(0)
+                results.append([(ids[i], float(scores[i])) for i in top_k(scores, k)])
+        return results
+
+    def identify(self, embedding, k=1):
+        """Return the k most similar speakers as a list of (speaker_id, similarity)."""
+        return self.search(embedding, k)[0]
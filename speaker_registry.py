@@ -0,0 +1,304 @@
+import itertools
+import numpy as np
+
+# Source of SpeakerRegistry.version values, unique across all registries in the process
+_versions = itertools.count()
+
+
+def l2_normalize(embeddings):
+    """Scale embeddings (1-D or 2-D) to unit length along the last axis."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Return the indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class CentroidStats:
+    """
+    Running statistics of one speaker's enrollment samples.
+
+    Keeps the count, the sum and the per-dimension sum of squares of the L2-normalized
+    sample embeddings (float64, so long add/remove sequences do not drift), plus each
+    sample's normalized embedding keyed by an ID such as its file path. Adding or
+    removing a sample is O(dim); nothing is re-embedded.
+    """
+
+    def __init__(self, dim=192):
+        self.dim = dim
+        self.count = 0
+        self.total = np.zeros(dim, dtype=np.float64)
+        self.total_sq = np.zeros(dim, dtype=np.float64)
+        self.samples = {}
+
+    def __len__(self):
+        return self.count
+
+    def copy(self):
+        """Independent copy; sample arrays are shared since they are never modified in place."""
+        other = CentroidStats(self.dim)
+        other.count = self.count
+        other.total = self.total.copy()
+        other.total_sq = self.total_sq.copy()
+        other.samples = dict(self.samples)
+        return other
+
+    def __contains__(self, key):
+        return key in self.samples
+
+    def add(self, key, embedding):
+        """Add a sample, replacing any earlier sample with the same key."""
+        if key in self.samples:
+            self.remove(key)
+        embedding = l2_normalize(embedding)
+        self.samples[key] = embedding
+        self.count += 1
+        self.total += embedding
+        self.total_sq += np.square(embedding, dtype=np.float64)
+
+    def remove(self, key):
+        """Remove a sample by key."""
+        embedding = self.samples.pop(key)
+        self.count -= 1
+        if self.count == 0:
+            # Reset exactly rather than keep accumulated rounding error
+            self.total[:] = 0
+            self.total_sq[:] = 0
+            return
+        self.total -= embedding
+        self.total_sq -= np.square(embedding, dtype=np.float64)
+
+    @property
+    def centroid(self):
+        """Normalized mean direction of the samples."""
+        return l2_normalize(self.total)
+
+    @property
+    def variance(self):
+        """Per-dimension variance of the normalized samples."""
+        mean = self.total / max(self.count, 1)
+        return np.maximum(self.total_sq / max(self.count, 1) - np.square(mean), 0)
+
+    def contributions(self):
+        """
+        Leave-one-out cosine of each sample against the centroid of the others.
+
+        A clip that does not sound like the rest of the enrollment scores low; with a
+        single sample there is nothing to compare against and its score is 1.
+        """
+        if self.count < 2:
+            return {key: 1.0 for key in self.samples}
+        keys = list(self.samples)
+        samples = np.stack([self.samples[key] for key in keys])
+        others = l2_normalize(self.total.astype(np.float32) - samples)
+        return dict(zip(keys, np.sum(samples * others, axis=1).tolist()))
+
+    def outlier_scores(self):
+        """Mean squared z-score of each sample under the per-dimension mean and variance."""
+        if self.count < 2:
+            return {key: 0.0 for key in self.samples}
+        keys = list(self.samples)
+        samples = np.stack([self.samples[key] for key in keys])
+        mean = self.total / self.count
+        return dict(zip(keys, np.mean(np.square(samples - mean) / (self.variance + 1e-12), axis=1).tolist()))
+
+
+class SpeakerRegistry:
+    """
+    Enrolled speakers held as L2-normalized centroids in one contiguous float32 matrix.
+
+    Identification is a single matrix-vector product followed by a top-k partial sort.
+    Rows are allocated with spare capacity, removal swaps the last row into the hole,
+    so add/update/remove never rebuild the matrix.
+
+    Speakers enrolled sample by sample (``add_sample``) keep ``CentroidStats``, so one
+    clip can be added, replaced or pruned without recomputing the rest.
+
+    ``index`` optionally takes an ann_index index (e.g. ``IVFIndex()``) that ``identify``
+    searches instead of scanning every row. It is kept in sync on every add, update and
+    remove under a stable integer key per speaker, since rows move on removal.
+
+    ``version`` changes on every add, update and remove (and differs between copies),
+    so callers can cache values aligned with the rows and rebuild them when it moves.
+    """
+
+    def __init__(self, dim=192, capacity=64, index=None):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self._stats = {}
+        # Speakers whose CentroidStats no copy shares, so they can be updated in place
+        self._owned = set()
+        self.index = index
+        self._keys = {}
+        self._by_key = {}
+        self._next_key = 0
+        self.version = next(_versions)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def copy(self):
+        """
+        Independent copy, e.g. to rebuild enrollment in the background while this one serves.
+
+        Per-speaker CentroidStats are shared until either side changes a speaker's
+        samples, which copies only that speaker's statistics.
+        """
+        other = SpeakerRegistry(self.dim, capacity=1, index=self.index.copy() if self.index is not None else None)
+        other._matrix = self._matrix.copy()
+        other._ids = list(self._ids)
+        other._rows = dict(self._rows)
+        other._stats = dict(self._stats)
+        self._owned = set()
+        other._keys = dict(self._keys)
+        other._by_key = dict(self._by_key)
+        other._next_key = self._next_key
+        return other
+
+    def __contains__(self, speaker_id):
+        return speaker_id in self._rows
+
+    @property
+    def speakers(self):
+        return list(self._ids)
+
+    @property
+    def centroids(self):
+        """View of the active rows, shape (num_speakers, dim)."""
+        return self._matrix[:len(self._ids)]
+
+    def _grow(self):
+        matrix = np.zeros((max(1, 2 * len(self._matrix)), self.dim), dtype=np.float32)
+        matrix[:len(self._ids)] = self.centroids
+        self._matrix = matrix
+
+    def add(self, speaker_id, embedding):
+        """Enroll a speaker, or replace its centroid if it is already enrolled."""
+        self._stats.pop(speaker_id, None)
+        self._set(speaker_id, embedding)
+
+    def _set(self, speaker_id, embedding):
+        if speaker_id in self._rows:
+            row = self._rows[speaker_id]
+        else:
+            if len(self._ids) == len(self._matrix):
+                self._grow()
+            row = len(self._ids)
+            self._ids.append(speaker_id)
+            self._rows[speaker_id] = row
+        self._matrix[row] = l2_normalize(embedding)
+        self.version = next(_versions)
+        if self.index is not None:
+            key = self._keys.get(speaker_id)
+            if key is None:
+                key = self._keys[speaker_id] = self._next_key
+                self._by_key[key] = speaker_id
+                self._next_key += 1
+            # Adding an existing key replaces its vector
+            self.index.add([key], self._matrix[row][None])
+
+    def update(self, speaker_id, embedding):
+        """Replace the centroid of an enrolled speaker in place."""
+        if speaker_id not in self._rows:
+            raise KeyError(speaker_id)
+        self._stats.pop(speaker_id, None)
+        self._set(speaker_id, embedding)
+
+    def add_sample(self, speaker_id, key, embedding):
+        """Add (or replace) one enrollment sample and refresh the speaker's centroid."""
+        stats = self._own_stats(speaker_id)
+        if stats is None:
+            stats = self._stats[speaker_id] = CentroidStats(self.dim)
+            self._owned.add(speaker_id)
+        stats.add(key, embedding)
+        self._set(speaker_id, stats.centroid)
+
+    def remove_sample(self, speaker_id, key):
+        """Drop one enrollment sample; the speaker is unenrolled when none are left."""
+        stats = self._own_stats(speaker_id)
+        if stats is None:
+            raise KeyError(speaker_id)
+        stats.remove(key)
+        if stats.count == 0:
+            self.remove(speaker_id)
+        else:
+            self._set(speaker_id, stats.centroid)
+
+    def _own_stats(self, speaker_id):
+        """The speaker's CentroidStats, copied first if a registry copy still shares them."""
+        stats = self._stats.get(speaker_id)
+        if stats is not None and speaker_id not in self._owned:
+            stats = self._stats[speaker_id] = stats.copy()
+            self._owned.add(speaker_id)
+        return stats
+
+    def samples(self, speaker_id):
+        """Keys of the samples behind a speaker's centroid (empty if it was set directly)."""
+        stats = self._stats.get(speaker_id)
+        return list(stats.samples) if stats is not None else []
+
+    def stats(self, speaker_id):
+        """The speaker's CentroidStats, or None if its centroid was set directly."""
+        return self._stats.get(speaker_id)
+
+    def contributions(self, speaker_id):
+        """Leave-one-out cosine of each of the speaker's samples, see CentroidStats.contributions."""
+        stats = self._stats.get(speaker_id)
+        return stats.contributions() if stats is not None else {}
+
+    def prune(self, speaker_id, min_similarity=0.5):
+        """Remove samples whose leave-one-out cosine is below min_similarity; returns their keys."""
+        scores = self.contributions(speaker_id)
+        pruned = [key for key, score in scores.items() if score < min_similarity]
+        if pruned and len(pruned) == len(scores):
+            # Keep the most typical sample so the speaker stays enrolled
+            pruned.remove(max(scores, key=scores.get))
+        for key in pruned:
+            self.remove_sample(speaker_id, key)
+        return pruned
+
+    def remove(self, speaker_id):
+        """Unenroll a speaker by moving the last row into its slot."""
+        self._stats.pop(speaker_id, None)
+        row = self._rows.pop(speaker_id)
+        if self.index is not None:
+            key = self._keys.pop(speaker_id)
+            del self._by_key[key]
+            self.index.remove([key])
+        last = len(self._ids) - 1
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self.version = next(_versions)
+
+    def get(self, speaker_id):
+        """Return the normalized centroid of a speaker."""
+        return self._matrix[self._rows[speaker_id]]
+
+    def score(self, speaker_id, embedding):
+        """Cosine similarity between an embedding and one enrolled speaker."""
+        return float(self.get(speaker_id) @ l2_normalize(embedding))
+
+    def scores(self, embedding):
+        """Cosine similarity against every enrolled speaker, in enrollment-row order."""
+        return self.centroids @ l2_normalize(embedding)
+
+    def identify(self, embedding, k=1):
+        """Return the k most similar speakers as a list of (speaker_id, similarity)."""
+        if self.index is not None:
+            scores, keys = self.index.search(embedding, k)
+            return [(self._by_key[key], float(score)) for score, key in zip(scores[0], keys[0]) if key >= 0]
+        scores = self.scores(embedding)
+        return [(self._ids[i], float(scores[i])) for i in top_k(scores, k)]
@@ -0,0 +1,130 @@
+import io
+import os
+import wave
+from collections import namedtuple
+import numpy as np
+from audio_io import TARGET_SAMPLE_RATE, StreamResampler, pcm_to_float
+from speaker_registry import l2_normalize
+
+# One scored window of a stream, times in seconds from the start of the recording
+WindowScore = namedtuple("WindowScore", ["start", "end", "similarity"])
+
+
+def iter_blocks(source, block_seconds=1.0):
+    """
+    Read a recording (path, bytes or binary file-like) in fixed-size blocks without loading it whole.
+
+    Yields 16 kHz mono float32 blocks. PCM WAV is read with the standard library,
+    other formats through soundfile. Blocks are resampled as one continuous signal, so
+    the output matches resampling the whole recording; block sizes may vary slightly.
+    A file-like source is read from its current position.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    start = source.tell() if hasattr(source, "tell") else None
+    try:
+        wf = wave.open(os.fspath(source) if isinstance(source, (str, os.PathLike)) else source, "rb")
+    except (wave.Error, EOFError):
+        wf = None
+        if start is not None:
+            source.seek(start)
+
+    if wf is not None:
+        with wf:
+            channels, sample_rate, width = wf.getnchannels(), wf.getframerate(), wf.getsampwidth()
+            frames_per_block = max(1, int(block_seconds * sample_rate))
+            resampler = StreamResampler(sample_rate)
+            while True:
+                frames = wf.readframes(frames_per_block)
+                if not frames:
+                    break
+                block = pcm_to_float(frames, width)
+                if channels > 1:
+                    block = block.reshape(-1, channels).mean(axis=1)
+                block = resampler.process(block)
+                if len(block):
+                    yield block
+    else:
+        import soundfile as sf
+
+        sample_rate = sf.info(source).samplerate
+        if start is not None:
+            source.seek(start)
+        resampler = StreamResampler(sample_rate)
+        for block in sf.blocks(source, blocksize=max(1, int(block_seconds * sample_rate)),
+                               dtype="float32", always_2d=True):
+            block = resampler.process(np.ascontiguousarray(block.mean(axis=1)))
+            if len(block):
+                yield block
+    tail = resampler.flush()
+    if len(tail):
+        yield tail
+
+
+def stream_scores(source, authorized_embedding_avg, window_seconds=3.0, hop_seconds=1.5,
+                  block_seconds=1.0, min_seconds=1.0, embed_fn=None):
+    """
+    Score overlapping windows of a long recording against an enrolled speaker as they arrive.
+
+    Yields a WindowScore for every ``window_seconds`` window, advancing by ``hop_seconds``
+    (at most ``window_seconds``).
+    At most one window plus one block of audio is held in memory regardless of the
+    recording length. Stop iterating at any point to end early. ``source`` may also be
+    any iterable of 16 kHz float32 blocks (e.g. a live input stream).
+    """
+    if embed_fn is None:
+        import app
+        embed_fn = app.get_embedding
+    reference = l2_normalize(authorized_embedding_avg)
+    window = int(window_seconds * TARGET_SAMPLE_RATE)
+    hop = int(hop_seconds * TARGET_SAMPLE_RATE)
+    if window <= 0 or hop <= 0:
+        raise ValueError(f"window_seconds and hop_seconds must be positive, got {window_seconds} and {hop_seconds}")
+    if hop > window:
+        # Windows overlap or touch; a longer hop would have to skip audio that was never buffered
+        raise ValueError(f"hop_seconds ({hop_seconds}) must not exceed window_seconds ({window_seconds})")
+
+    blocks = source if _is_block_iterable(source) else iter_blocks(source, block_seconds)
+    buffer = np.empty(0, dtype=np.float32)
+    offset = 0  # sample index of buffer[0] in the whole recording
+    scored_until = 0  # end of the last scored window
+
+    def score(start, end):
+        similarity = float(l2_normalize(embed_fn(buffer[start - offset:end - offset])) @ reference)
+        return WindowScore(start / TARGET_SAMPLE_RATE, end / TARGET_SAMPLE_RATE, similarity)
+
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= window:
+            yield score(offset, offset + window)
+            scored_until = offset + window
+            buffer = buffer[hop:]
+            offset += hop
+
+    # Tail that no full window covered (or the whole recording if it is shorter than a window)
+    end = offset + len(buffer)
+    if len(buffer) and (scored_until == 0 or end - scored_until >= min_seconds * TARGET_SAMPLE_RATE):
+        yield score(offset, end)
+
+
+def _is_block_iterable(source):
+    return not isinstance(source, (str, bytes, bytearray, memoryview, os.PathLike)) and not hasattr(source, "read")
+
+
+def verify_stream(source, authorized_embedding_avg, threshold=0.75, margin=0.05, min_windows=3, **kwargs):
+    """
+    Stream a recording and stop as soon as the decision is confident.
+
+    The decision is taken once at least ``min_windows`` windows have been scored and
+    their running mean is more than ``margin`` away from the threshold; otherwise the
+    whole recording is consumed. Returns (is_authorized, mean_similarity, window_scores).
+    """
+    scores = []
+    total = 0.0
+    for window_score in stream_scores(source, authorized_embedding_avg, **kwargs):
+        scores.append(window_score)
+        total += window_score.similarity
+        if len(scores) >= min_windows and abs(total / len(scores) - threshold) > margin:
+            break
+    mean = total / len(scores) if scores else 0.0
+    return mean >= threshold, mean, scores
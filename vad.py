@@ -0,0 +1,61 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_io import TARGET_SAMPLE_RATE
+
+
+def frame_energy_db(signal, frame_length=400, hop_length=160):
+    """RMS energy in dB of every frame, computed on a strided view (no copies per frame)."""
+    if len(signal) < frame_length:
+        signal = np.pad(signal, (0, frame_length - len(signal)))
+    frames = sliding_window_view(signal, frame_length)[::hop_length]
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_mask(signal, sample_rate=TARGET_SAMPLE_RATE, frame_ms=25, hop_ms=10,
+                floor_margin_db=12.0, dynamic_range_db=45.0, hangover_ms=200):
+    """
+    Energy-based voice activity per frame; returns (mask, hop_length).
+
+    A frame is speech when it is ``floor_margin_db`` above the noise floor (10th
+    percentile of frame energy) and within ``dynamic_range_db`` of the loudest frame.
+    Detected speech is extended by ``hangover_ms`` on both sides so word onsets and
+    short pauses are kept.
+    """
+    frame_length = int(sample_rate * frame_ms / 1000)
+    hop_length = int(sample_rate * hop_ms / 1000)
+    energy = frame_energy_db(signal, frame_length, hop_length)
+    threshold = max(np.percentile(energy, 10) + floor_margin_db, energy.max() - dynamic_range_db)
+    mask = energy > threshold
+
+    hangover = int(hangover_ms / hop_ms)
+    if hangover and mask.any():
+        mask = np.convolve(mask, np.ones(2 * hangover + 1), mode="same") > 0
+    return mask, hop_length
+
+
+def speech_segments(signal, sample_rate=TARGET_SAMPLE_RATE, **kwargs):
+    """Sample ranges [(start, end), ...] that contain speech."""
+    mask, hop_length = speech_mask(signal, sample_rate, **kwargs)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    starts, ends = edges[::2] * hop_length, np.minimum(edges[1::2] * hop_length, len(signal))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def trim_silence(signal, sample_rate=TARGET_SAMPLE_RATE, min_speech_seconds=0.5, **kwargs):
+    """
+    Keep only the speech segments of a signal; returns (speech, speech_ratio).
+
+    If less than ``min_speech_seconds`` of speech is found the signal is returned
+    unchanged, so very short or very quiet clips still get an embedding.
+    """
+    if len(signal) == 0:
+        return signal, 0.0
+    segments = speech_segments(signal, sample_rate, **kwargs)
+    speech_samples = sum(end - start for start, end in segments)
+    speech_ratio = speech_samples / len(signal)
+    if speech_samples < min_speech_seconds * sample_rate:
+        return signal, speech_ratio
+    if speech_samples == len(signal):
+        return signal, 1.0
+    return np.concatenate([signal[start:end] for start, end in segments]), speech_ratio